@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vpin'))
+from simulate import Simulation
+from ticks import compact, DailyBars, daily_volume
+from estimators import estimate_batch, columns
+from trading_calendar import is_session
+from metrics import peak_rss
+from engine import ChunkedVPIN, time_bars, bvc, get_V
+
+# benchmark the pipeline's stages on simulated ticks:
+# python benchmark.py 1e6 1e7 1e8 (default: all three)
+sizes = [int(float(e)) for e in sys.argv[1:]] or [10**6, 10**7, 10**8]
+chunk_ticks = 1000000
+days = 240 # i.e., four 60-day quarters
+quarter_days = 60
+method = 'GAN'
+likelihood = 'LK'
+n = 250 # VPIN buckets
+
+class Stage:
+    '''
+    accumulates wall time, rows and peak traced memory
+    over any number of runs of a stage
+    '''
+
+    def __init__(self):
+        self.seconds = 0
+        self.rows = 0
+        self.peak = 0
+
+    def run(self, rows, f, *args, **kwargs):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        out = f(*args, **kwargs)
+        self.seconds += time.perf_counter() - t0
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - base)
+        self.rows += rows
+        return out
+
+def chunks(sim, stage):
+    '''
+    sim's ticks, chunk_ticks at a time, timed as stage
+    '''
+    chunks = sim.chunks(chunk_ticks)
+    while True:
+        raw = stage.run(0, next, chunks, None)
+        if raw is None:
+            return
+        stage.rows += len(raw)
+        yield raw
+
+tracemalloc.start()
+report = []
+recovery = []
+for size in sizes:
+    sim = Simulation.of_size(size, days = days)
+    stages = {name: Stage() for name in ['simulate', 'classify', 'aggregate', 'estimate', 'vpin', 'bvc']}
+
+    # ticks come in chunks, as off the database; the first pass
+    # gets what the database would aggregate: daily bars, daily
+    # volume (for V) and 1-minute bars (for BVC, as off the
+    # rollups; chunks are whole days, so no bar straddles two)
+    daily = DailyBars()
+    volumes = []
+    minute_bars = []
+    for raw in chunks(sim, stages['simulate']):
+        ticks = stages['classify'].run(len(raw), compact, raw, False)
+        stages['aggregate'].run(len(ticks), daily.add, ticks)
+        volumes.append(stages['aggregate'].run(0, daily_volume, ticks))
+        minute_bars.append(stages['bvc'].run(len(ticks), time_bars, ticks['time'].values.astype('datetime64[ns]'), ticks['price'].values, ticks['volume'].values))
+        del raw, ticks
+    bars = stages['aggregate'].run(0, daily.bars)
+    V = get_V(np.concatenate(volumes))
+
+    # PIN, quarter by quarter, against the true parameters
+    bars = bars[is_session(bars.index.values)]
+    series = []
+    for q in range(0, len(bars) - quarter_days + 1, quarter_days):
+        df = bars.iloc[q:q + quarter_days]
+        df = df[(df['B'] > 0) | (df['S'] > 0)]
+        series.append((df['B'].values, df['S'].values))
+    estimates = stages['estimate'].run(len(bars), estimate_batch, series, method, likelihood)
+    truth = list(sim.params) + [np.nan, sim.pin()]
+    for e in estimates:
+        if e is None:
+            continue
+        for col, true, value in zip(columns, truth, e):
+            if col != 'likelihood':
+                recovery.append((size, col, true, value, abs(value - true) / abs(true)))
+
+    # VPIN over the whole series: by flags, streaming the ticks
+    # again, chunk by chunk, through the engine vpin.py uses; by
+    # BVC, on the 1-minute bars
+    engine = ChunkedVPIN(V, n)
+    for raw in chunks(sim, stages['simulate']):
+        ticks = stages['classify'].run(len(raw), compact, raw)
+        stages['vpin'].run(len(ticks), engine.update_many, ticks['time'].values.astype('datetime64[ns]'), ticks['volume'].values, ticks['side'].values == 1)
+        del raw, ticks
+    bar_times, close, volume = [np.concatenate(e) for e in zip(*minute_bars)]
+    stages['bvc'].run(0, bvc, bar_times, close, volume, V, n)
+    del minute_bars, bar_times, close, volume
+
+    for name, stage in stages.items():
+        report.append((size, name, stage.rows, stage.seconds, stage.rows / stage.seconds / 1e6 if stage.seconds else np.nan, stage.peak / 2**20))
+    print(size, 'ticks done', flush = True)
+
+tracemalloc.stop()
+report = pd.DataFrame(report, columns = ['ticks', 'stage', 'rows', 'seconds', 'Mrows/s', 'peak MB'])
+print(report.to_string(index = False, float_format = '{:.3f}'.format))
+rss = peak_rss()
+print('peak RSS:', 'n/a' if rss is None else '{:.0f} MB'.format(rss))
+
+# parameter recovery: median relative error across quarters
+# (vs the true parameters, so it includes sampling error)
+recovery = pd.DataFrame(recovery, columns = ['ticks', 'parameter', 'true', 'estimate', 'relative error'])
+print(recovery.groupby(['ticks', 'parameter'], sort = False)['relative error'].median().unstack().to_string(float_format = '{:.4f}'.format))
@@ -0,0 +1,25 @@
+import pyodbc
+from db import get_tickers
+import tickstore
+
+# path to the tick store
+store_path = '/path/to/tickstore/'
+
+# connect to database
+cnxn = pyodbc.connect(
+    driver = 'ODBC Driver 17 for SQL Server',
+    server = 'SqlServerName',
+    database = 'DbName',
+    uid = 'uid',
+    pwd = 'pwd',
+    chartset = 'UTF-8'
+)
+dialect = 'mssql'
+
+# copy every ticker's table into the store
+tickers = get_tickers(cnxn, dialect)
+for i, ticker in enumerate(tickers):
+    n = tickstore.convert(cnxn, store_path, ticker, dialect = dialect)
+    print(i, 'of', len(tickers), ticker, n)
+
+cnxn.close()
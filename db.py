@@ -0,0 +1,710 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+# tick table schema, as created by scrape_data.py
+schema = [
+    ('ticktime', 'datetime'),
+    ('bid', 'smallmoney'),
+    ('ask', 'smallmoney'),
+    ('last', 'smallmoney'),
+    ('volume', 'int'),
+    ('time_msc', 'bigint'),
+    ('flags', 'smallint'),
+    ('volume_real', 'int'),
+    ]
+
+# SQLite stand-in for SQL Server types
+sqlite_types = {
+    'datetime': 'TEXT',
+    'smallmoney': 'REAL',
+    'int': 'INTEGER',
+    'bigint': 'INTEGER',
+    'smallint': 'INTEGER',
+    }
+
+def table(ticker, dialect = 'mssql'):
+    if dialect == 'mssql':
+        return '[db_stonks].[dbo].[{}]'.format(ticker)
+    elif dialect == 'sqlite':
+        return '"{}"'.format(ticker)
+    raise ValueError('unknown dialect: {}'.format(dialect))
+
+def create_table(cnxn, ticker, dialect = 'mssql'):
+    '''
+    create an empty tick table for ticker
+    '''
+    if dialect == 'mssql':
+        cols = ['{} {}'.format(name, kind) for name, kind in schema]
+        query = 'CREATE TABLE {} ({});'.format(ticker, ', '.join(cols))
+    else:
+        cols = ['{} {}'.format(name, sqlite_types[kind]) for name, kind in schema]
+        query = 'CREATE TABLE {} ({});'.format(table(ticker, dialect), ', '.join(cols))
+    cursor = cnxn.cursor()
+    cursor.execute(query)
+    cnxn.commit()
+
+def get_tickers(cnxn, dialect = 'mssql'):
+    '''
+    names of all tables that look like B3 stock tickers
+    '''
+    if dialect == 'mssql':
+        names = [row.table_name for row in cnxn.cursor().tables()]
+    else:
+        query = "SELECT name FROM sqlite_master WHERE type = 'table'"
+        names = [row[0] for row in cnxn.execute(query)]
+    tickers = []
+    for table_name in names:
+        if len(table_name) in (5, 6):
+            if table_name[:4].isalpha():
+                if table_name[:4].isupper():
+                    if table_name[4:].isnumeric():
+                        tickers.append(table_name)
+    return sorted(tickers)
+
+def table_sizes(cnxn, dialect = 'mssql'):
+    '''
+    number of rows in each table, from the catalog where
+    possible (i.e., w/o scanning the tables)
+    '''
+    if dialect == 'mssql':
+        query = '''
+        SELECT t.name, SUM(p.rows)
+        FROM sys.tables t
+        JOIN sys.partitions p ON t.object_id = p.object_id
+        WHERE p.index_id IN (0, 1)
+        GROUP BY t.name
+        '''
+        return {row[0]: int(row[1]) for row in cnxn.cursor().execute(query).fetchall()}
+    sizes = {}
+    for ticker in get_tickers(cnxn, dialect):
+        query = 'SELECT COUNT(*) FROM {}'.format(table(ticker, dialect))
+        sizes[ticker] = cnxn.execute(query).fetchone()[0]
+    return sizes
+
+def execute(cnxn, query):
+    '''
+    run query and return a cursor positioned at its first
+    result set (past the empty results of SET statements),
+    or None if there is no result set
+    '''
+    cursor = cnxn.cursor()
+    cursor.execute(query)
+    while cursor.description is None:
+        if not (hasattr(cursor, 'nextset') and cursor.nextset()):
+            cursor.close()
+            return None
+    return cursor
+
+def where(date_start, date_end, dialect = 'mssql'):
+    if dialect == 'mssql':
+        return '''
+        WHERE [ticktime] >= CAST(N'{} 00:00:00' AS DateTime)
+        AND [ticktime] <= CAST(N'{} 23:59:59' AS DateTime)
+        '''.format(date_start, date_end)
+    return '''
+        WHERE ticktime >= '{} 00:00:00'
+        AND ticktime <= '{} 23:59:59'
+        '''.format(date_start, date_end)
+
+def ticks_query(ticker, date_start, date_end, columns = ('ticktime', 'flags'), dialect = 'mssql'):
+    '''
+    query for the ticks of one ticker between two dates
+    (inclusive), in time order (to the millisecond, so that
+    ticks in the same second come in the same order every time)
+    '''
+    if dialect == 'mssql':
+        prefix = 'SET DATEFORMAT ymd;'
+        columns = ', '.join('[{}]'.format(e) for e in columns)
+        order = '[ticktime], [time_msc]'
+    else:
+        prefix = ''
+        columns = ', '.join(columns)
+        order = 'ticktime, time_msc'
+    return '''
+        {}
+
+        SELECT {}
+        FROM {}
+        {}
+        ORDER BY {}
+        '''.format(prefix, columns, table(ticker, dialect), where(date_start, date_end, dialect), order)
+
+def daily_bars_query(ticker, date_start, date_end, dialect = 'mssql'):
+    '''
+    query that classifies ticks and counts buys and sells by
+    trade date inside the database; a tick w/ both flags or
+    neither flag is neither a buy nor a sell, as in ticks.py
+    '''
+    if dialect == 'mssql':
+        return '''
+        SET DATEFORMAT ymd;
+
+        SELECT
+            CAST([ticktime] AS date) AS [date],
+            SUM(CASE WHEN [flags] & 32 <> 0 AND [flags] & 64 = 0 THEN 1 ELSE 0 END) AS [B],
+            SUM(CASE WHEN [flags] & 64 <> 0 AND [flags] & 32 = 0 THEN 1 ELSE 0 END) AS [S],
+            COUNT(*) AS [ticks]
+        FROM {}
+        {}
+        GROUP BY CAST([ticktime] AS date)
+        ORDER BY CAST([ticktime] AS date)
+        '''.format(table(ticker, dialect), where(date_start, date_end, dialect))
+    return '''
+        SELECT
+            date(ticktime) AS date,
+            SUM(CASE WHEN flags & 32 <> 0 AND flags & 64 = 0 THEN 1 ELSE 0 END) AS B,
+            SUM(CASE WHEN flags & 64 <> 0 AND flags & 32 = 0 THEN 1 ELSE 0 END) AS S,
+            COUNT(*) AS ticks
+        FROM {}
+        {}
+        GROUP BY date(ticktime)
+        ORDER BY date(ticktime)
+        '''.format(table(ticker, dialect), where(date_start, date_end, dialect))
+
+def read_daily_bars(cnxn, ticker, date_start, date_end, dialect = 'mssql'):
+    '''
+    daily buy (B), sell (S) and total (ticks) counts,
+    aggregated by the database, one row per calendar day from
+    the first to the last trade date (like ticks.daily_bars)
+    '''
+    cursor = execute(cnxn, daily_bars_query(ticker, date_start, date_end, dialect))
+    rows = []
+    if cursor is not None:
+        rows = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+    df = pd.DataFrame.from_records(rows, columns = ['date', 'B', 'S', 'ticks'])
+    df.index = pd.DatetimeIndex(pd.to_datetime(df['date']).values.astype('datetime64[D]'))
+    df = df[['B', 'S', 'ticks']].astype(np.int64)
+    if len(df):
+        df = df.asfreq('D', fill_value = 0)
+    return df
+
+def read_daily_volume(cnxn, ticker, date_start, date_end, dialect = 'mssql'):
+    '''
+    total volume of each trade date from date_start to
+    date_end in the ticker's table
+    '''
+    if dialect == 'mssql':
+        query = '''
+        SET DATEFORMAT ymd;
+
+        SELECT 
+            CAST(ticktime AS date) AS date, 
+            SUM(volume) AS volume 
+        FROM dbo.[{}] 
+        {}
+        GROUP BY CAST(ticktime AS date) 
+        ORDER BY CAST(ticktime AS date)
+        '''.format(ticker, where(date_start, date_end, dialect))
+    else:
+        query = '''
+        SELECT
+            date(ticktime) AS date,
+            SUM(volume) AS volume
+        FROM {}
+        {}
+        GROUP BY date(ticktime)
+        ORDER BY date(ticktime)
+        '''.format(table(ticker, dialect), where(date_start, date_end, dialect))
+    cursor = execute(cnxn, query)
+    if cursor is None:
+        return np.zeros(0, dtype = np.int64)
+    volumes = np.array([row[1] for row in cursor.fetchall()], dtype = np.int64)
+    cursor.close()
+    return volumes
+
+# which trade dates each tick table covers: one row per (ticker,
+# date) written, w/ how many ticks it has and whether the session
+# was over when it was fetched (complete = 0 means it was fetched
+# mid-session and needs fetching again)
+coverage = 'coverage'
+
+def create_coverage(cnxn, dialect = 'mssql'):
+    '''
+    create the coverage table, unless it's there already
+    '''
+    if dialect == 'mssql':
+        query = '''
+        IF OBJECT_ID(N'{0}', N'U') IS NULL
+        CREATE TABLE {0} (
+            ticker varchar(10),
+            date date,
+            ticks int,
+            complete bit,
+            PRIMARY KEY (ticker, date)
+        );
+        '''.format(table(coverage, dialect))
+    else:
+        query = '''
+        CREATE TABLE IF NOT EXISTS {} (
+            ticker TEXT,
+            date TEXT,
+            ticks INTEGER,
+            complete INTEGER,
+            PRIMARY KEY (ticker, date)
+        );
+        '''.format(table(coverage, dialect))
+    cursor = cnxn.cursor()
+    cursor.execute(query)
+    cnxn.commit()
+
+def covered_dates(cnxn, ticker, dialect = 'mssql'):
+    '''
+    trade dates of ticker that were completely fetched, or None
+    if the coverage table knows nothing about ticker
+    '''
+    query = 'SELECT date, complete FROM {} WHERE ticker = ?'.format(table(coverage, dialect))
+    cursor = cnxn.cursor()
+    cursor.execute(query, (ticker,))
+    rows = cursor.fetchall()
+    cursor.close()
+    if len(rows) == 0:
+        return None
+    return set(pd.to_datetime([row[0] for row in rows if row[1]]).date)
+
+def set_coverage(cursor, ticker, days, dialect = 'mssql'):
+    '''
+    record (date, ticks, complete) triples of ticker (through
+    cursor, so the caller decides when to commit)
+    '''
+    if len(days) == 0:
+        return
+    days = [(ticker, day if dialect == 'mssql' else str(day), int(n), int(complete)) for day, n, complete in days]
+    cursor.executemany(
+        'DELETE FROM {} WHERE ticker = ? AND date = ?'.format(table(coverage, dialect)),
+        [e[:2] for e in days]
+        )
+    cursor.executemany('INSERT INTO {} VALUES (?, ?, ?, ?)'.format(table(coverage, dialect)), days)
+
+def index_coverage(cnxn, ticker, dialect = 'mssql'):
+    '''
+    fill in the coverage of a table that predates the coverage
+    table, from the table itself (one scan, once); days before
+    today count as complete
+    '''
+    if dialect == 'mssql':
+        query = '''
+        SELECT CAST([ticktime] AS date), COUNT(*)
+        FROM {0}
+        GROUP BY CAST([ticktime] AS date)
+        '''.format(table(ticker, dialect))
+    else:
+        query = '''
+        SELECT date(ticktime), COUNT(*)
+        FROM {0}
+        GROUP BY date(ticktime)
+        '''.format(table(ticker, dialect))
+    cursor = cnxn.cursor()
+    cursor.execute(query)
+    days = [(pd.Timestamp(row[0]).date(), row[1]) for row in cursor.fetchall()]
+    set_coverage(cursor, ticker, [(day, n, day < date.today()) for day, n in days], dialect)
+    cnxn.commit()
+    cursor.close()
+    return len(days)
+
+# per-ticker rollups kept by the scraper as ticks are written:
+# 1-minute bars and daily totals (see ticks.rollups)
+minute_rollup = 'rollup_1m'
+daily_rollup = 'rollup_1d'
+minute_columns = [
+    ('minute', 'datetime'),
+    ('open', 'float'),
+    ('high', 'float'),
+    ('low', 'float'),
+    ('close', 'float'),
+    ('volume', 'bigint'),
+    ('ticks', 'int'),
+    ('buys', 'int'),
+    ('sells', 'int'),
+    ('buy_volume', 'bigint'),
+    ('sell_volume', 'bigint'),
+    ]
+daily_columns = [('date', 'date')] + minute_columns[5:]
+sqlite_types.update({'float': 'REAL', 'date': 'TEXT'})
+
+def create_rollups(cnxn, dialect = 'mssql'):
+    '''
+    create the rollup tables, unless they're there already
+    '''
+    cursor = cnxn.cursor()
+    for name, columns in ((minute_rollup, minute_columns), (daily_rollup, daily_columns)):
+        if dialect == 'mssql':
+            cols = ['ticker varchar(10)'] + ['{} {}'.format(col, kind) for col, kind in columns]
+            query = '''
+            IF OBJECT_ID(N'{0}', N'U') IS NULL
+            CREATE TABLE {0} ({1}, PRIMARY KEY (ticker, {2}));
+            '''.format(table(name, dialect), ', '.join(cols), columns[0][0])
+        else:
+            cols = ['ticker TEXT'] + ['{} {}'.format(col, sqlite_types[kind]) for col, kind in columns]
+            query = '''
+            CREATE TABLE IF NOT EXISTS {0} ({1}, PRIMARY KEY (ticker, {2}));
+            '''.format(table(name, dialect), ', '.join(cols), columns[0][0])
+        cursor.execute(query)
+    cnxn.commit()
+    cursor.close()
+
+def write_rollups(cursor, ticker, days, ticks, dialect = 'mssql'):
+    '''
+    replace the rollups of ticker's trade dates `days` w/ the
+    ones of `ticks` (columns ticktime, last, volume, flags), through
+    cursor, so the caller decides when to commit
+    '''
+    from ticks import rollups # (ticks imports db)
+    minutes, daily = rollups(ticks['ticktime'], ticks['last'], ticks['volume'], ticks['flags'])
+    bounds = np.array([[day, day] for day in sorted(days)], dtype = 'datetime64[D]') + [0, 1]
+    for name, columns, df in ((minute_rollup, minute_columns, minutes), (daily_rollup, daily_columns, daily)):
+        key = columns[0][0]
+        values = [df[col].values for col, kind in columns]
+        if dialect == 'mssql':
+            cursor.executemany(
+                'DELETE FROM {} WHERE ticker = ? AND [{}] >= ? AND [{}] < ?'.format(table(name, dialect), key, key),
+                [(ticker,) + tuple(b) for b in bounds.astype('datetime64[ms]').astype(object).tolist()]
+                )
+            values[0] = values[0].astype('datetime64[ms]').astype(object)
+            if key == 'date':
+                values[0] = [e.date() for e in values[0]]
+        else:
+            cursor.executemany(
+                'DELETE FROM {} WHERE ticker = ? AND {} >= ? AND {} < ?'.format(table(name, dialect), key, key),
+                [(ticker,) + tuple(b) for b in np.datetime_as_string(bounds).tolist()]
+                )
+            unit = 'D' if key == 'date' else 's'
+            values[0] = np.char.replace(np.datetime_as_string(values[0].astype('datetime64[{}]'.format(unit))), 'T', ' ')
+        rows = list(zip(*([[ticker] * len(df)] + [np.asarray(v).tolist() for v in values])))
+        if len(rows):
+            cursor.executemany(
+                'INSERT INTO {} VALUES ({})'.format(table(name, dialect), ', '.join('?' * (len(columns) + 1))),
+                rows
+                )
+
+def build_rollups(cnxn, ticker, dialect = 'mssql', chunksize = 1000000):
+    '''
+    (re)build the rollups of a table from its ticks, e.g. for
+    tables from before the rollup tables; one scan, holding
+    chunksize ticks (plus one trade date) at a time
+    '''
+    columns = ['ticktime', 'last', 'volume', 'flags']
+    cursor = execute(cnxn, ticks_query(ticker, '1900-01-01', '2100-12-31', columns = columns, dialect = dialect))
+    if cursor is None:
+        return 0
+    writer = cnxn.cursor()
+    carry = None
+    n = 0
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        df = pd.DataFrame.from_records([tuple(row) for row in rows], columns = columns)
+        df['ticktime'] = pd.to_datetime(df['ticktime'])
+        if carry is not None:
+            df = pd.concat([carry, df], ignore_index = True)
+        if len(df) == 0:
+            break
+        day = df['ticktime'].values.astype('datetime64[D]')
+
+        # the last trade date may go on in the next chunk
+        last = (day == day[-1]) if rows else np.zeros(len(df), dtype = bool)
+        carry = df[last]
+        done = df[~last]
+        if len(done):
+            days = np.unique(day[~last]).tolist()
+            write_rollups(writer, ticker, days, done, dialect)
+            n += len(days)
+        if not rows:
+            break
+    cnxn.commit()
+    cursor.close()
+    writer.close()
+    return n
+
+def read_rollup_bars(cnxn, ticker, date_start, date_end, dialect = 'mssql'):
+    '''
+    like read_daily_bars(), but off the daily rollups
+    '''
+    query = '''
+        SELECT date, buys, sells, ticks FROM {}
+        WHERE ticker = ? AND date >= ? AND date <= ?
+        ORDER BY date
+        '''.format(table(daily_rollup, dialect))
+    cursor = cnxn.cursor()
+    cursor.execute(query, (ticker, date_start, date_end))
+    rows = [tuple(row) for row in cursor.fetchall()]
+    cursor.close()
+    df = pd.DataFrame.from_records(rows, columns = ['date', 'B', 'S', 'ticks'])
+    df.index = pd.DatetimeIndex(pd.to_datetime(df['date']).values.astype('datetime64[D]'))
+    df = df[['B', 'S', 'ticks']].astype(np.int64)
+    if len(df):
+        df = df.asfreq('D', fill_value = 0)
+    return df
+
+def read_rollup_volume(cnxn, ticker, date_start = '1900-01-01', date_end = '2100-12-31', dialect = 'mssql'):
+    '''
+    like read_daily_volume(), but off the daily rollups
+    '''
+    query = '''
+        SELECT volume FROM {}
+        WHERE ticker = ? AND date >= ? AND date <= ?
+        ORDER BY date
+        '''.format(table(daily_rollup, dialect))
+    cursor = cnxn.cursor()
+    cursor.execute(query, (ticker, date_start, date_end))
+    volumes = np.array([row[0] for row in cursor.fetchall()], dtype = np.int64)
+    cursor.close()
+    return volumes
+
+def has_table(cnxn, name, dialect = 'mssql'):
+    if dialect == 'mssql':
+        cursor = execute(cnxn, "SELECT OBJECT_ID(N'{}', N'U')".format(table(name, dialect)))
+        found = cursor.fetchone()[0] is not None
+        cursor.close()
+        return found
+    query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return cnxn.execute(query, (name,)).fetchone() is not None
+
+def window_query(ticker, date_start, date_end, dialect = 'mssql'):
+    '''
+    query that totals ticks, volume, buys and sells by trade
+    date inside the database (the daily rollups' totals)
+    '''
+    if dialect == 'mssql':
+        return '''
+        SET DATEFORMAT ymd;
+
+        SELECT
+            CAST([ticktime] AS date) AS [date],
+            COUNT(*) AS [ticks],
+            SUM(CAST([volume] AS bigint)) AS [volume],
+            SUM(CASE WHEN [flags] & 32 <> 0 AND [flags] & 64 = 0 THEN 1 ELSE 0 END) AS [buys],
+            SUM(CASE WHEN [flags] & 64 <> 0 AND [flags] & 32 = 0 THEN 1 ELSE 0 END) AS [sells]
+        FROM {}
+        {}
+        GROUP BY CAST([ticktime] AS date)
+        ORDER BY CAST([ticktime] AS date)
+        '''.format(table(ticker, dialect), where(date_start, date_end, dialect))
+    return '''
+        SELECT
+            date(ticktime) AS date,
+            COUNT(*) AS ticks,
+            SUM(volume) AS volume,
+            SUM(CASE WHEN flags & 32 <> 0 AND flags & 64 = 0 THEN 1 ELSE 0 END) AS buys,
+            SUM(CASE WHEN flags & 64 <> 0 AND flags & 32 = 0 THEN 1 ELSE 0 END) AS sells
+        FROM {}
+        {}
+        GROUP BY date(ticktime)
+        ORDER BY date(ticktime)
+        '''.format(table(ticker, dialect), where(date_start, date_end, dialect))
+
+def window_totals(cnxn, tickers, date_start, date_end, dialect = 'mssql'):
+    '''
+    ticker -> [(date, ticks, volume, buys, sells), ...] of every
+    trade date from date_start to date_end, i.e. the data that
+    estimates over that window depend on (e.g., to fingerprint
+    them); read off the daily rollups in one query for tickers
+    the scraper keeps rollups of, by scanning the window of
+    each other ticker's table
+    '''
+    totals = dict((ticker, []) for ticker in tickers)
+    if has_table(cnxn, daily_rollup, dialect):
+        query = '''
+            SELECT ticker, date, ticks, volume, buys, sells FROM {}
+            WHERE date >= ? AND date <= ?
+            ORDER BY ticker, date
+            '''.format(table(daily_rollup, dialect))
+        cursor = cnxn.cursor()
+        cursor.execute(query, (date_start, date_end))
+        for row in cursor.fetchall():
+            if row[0] in totals:
+                totals[row[0]].append((str(pd.Timestamp(row[1]).date()),) + tuple(int(e) for e in row[2:]))
+        cursor.close()
+    for ticker in tickers:
+        if len(totals[ticker]):
+            continue
+        cursor = execute(cnxn, window_query(ticker, date_start, date_end, dialect))
+        if cursor is None:
+            continue
+        totals[ticker] = [(str(pd.Timestamp(row[0]).date()),) + tuple(int(e) for e in row[1:]) for row in cursor.fetchall()]
+        cursor.close()
+    return totals
+
+def read_minute_bars(cnxn, ticker, date_start, date_end, dialect = 'mssql'):
+    '''
+    a ticker's 1-minute bars between two dates (inclusive)
+    '''
+    names = [col for col, kind in minute_columns]
+    query = '''
+        SELECT {} FROM {}
+        WHERE ticker = ? AND minute >= ? AND minute < ?
+        ORDER BY minute
+        '''.format(', '.join(names), table(minute_rollup, dialect))
+    end = str(np.datetime64(date_end, 'D') + 1)
+    cursor = cnxn.cursor()
+    cursor.execute(query, (ticker, date_start, end))
+    df = pd.DataFrame.from_records([tuple(row) for row in cursor.fetchall()], columns = names)
+    cursor.close()
+    df['minute'] = pd.to_datetime(df['minute'])
+    return df
+
+# how each column is buffered before a bulk insert
+buffer_types = {
+    'ticktime': 'datetime64[s]',
+    'bid': np.float64,
+    'ask': np.float64,
+    'last': np.float64,
+    'volume': np.int64,
+    'time_msc': np.int64,
+    'flags': np.int16,
+    'volume_real': np.int64,
+    }
+
+class BulkWriter:
+    '''
+    buffers the ticks of many (ticker, day) pairs as typed column
+    arrays and writes them in bulk, batch_rows at a time: one
+    transaction per ticker that deletes the buffered days' rows
+    and inserts the new ones (so writing a day again replaces it
+    instead of duplicating it); the delete is one statement per
+    ticker (per 500 days), as tick tables have no index on
+    ticktime and each statement scans the table; on SQL Server
+    the inserts go through pyodbc's fast_executemany (parameter
+    arrays, not row-by-row round trips)
+
+    w/ track = True, each written day is also recorded in the
+    coverage table, and w/ rollup = True its 1-minute bars and
+    daily totals are replaced, in the same transaction
+    '''
+
+    def __init__(self, cnxn, dialect = 'mssql', batch_rows = 1000000, track = False, rollup = False):
+        self.cnxn = cnxn
+        self.dialect = dialect
+        self.batch_rows = batch_rows
+        self.track = track
+        self.rollup = rollup
+        self.buffers = {}
+        self.complete = {}
+        self.rows = 0
+
+    def add(self, ticker, day, ticks):
+        '''
+        buffer a day's ticks (a frame w/ the tick table's columns),
+        replacing whatever is buffered for that day
+        '''
+        columns = {name: np.asarray(ticks[name]).astype(buffer_types[name]) for name, kind in schema}
+        days = self.buffers.setdefault(ticker, {})
+        if day in days:
+            self.rows -= len(days[day]['ticktime'])
+        days[day] = columns
+        self.complete[(ticker, day)] = day < date.today() # i.e., the session is over
+        self.rows += len(ticks)
+        if self.rows >= self.batch_rows:
+            self.flush()
+
+    def params(self, columns):
+        if self.dialect == 'mssql':
+            ticktime = columns['ticktime'].astype('datetime64[ms]').astype(object)
+        else:
+            ticktime = np.char.replace(np.datetime_as_string(columns['ticktime'], unit = 's'), 'T', ' ')
+        cols = [ticktime.tolist()] + [columns[name].tolist() for name, kind in schema[1:]]
+        return list(zip(*cols))
+
+    def flush(self):
+        '''
+        write everything that's buffered
+        '''
+        names = [name for name, kind in schema]
+        if self.dialect == 'mssql':
+            quote = '[{}]'.format
+            trade_date = 'CAST([ticktime] AS date)'
+        else:
+            quote = '{}'.format
+            trade_date = 'date(ticktime)'
+        for ticker, days in self.buffers.items():
+            insert = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                table(ticker, self.dialect),
+                ', '.join(quote(name) for name in names),
+                ', '.join('?' * len(names))
+                )
+            columns = {name: np.concatenate([days[day][name] for day in sorted(days)]) for name in names}
+
+            # the buffered days, w/in the span they cover (which
+            # an index on ticktime, if any, can seek)
+            deletes = []
+            for i in range(0, len(days), 500):
+                chunk = np.array(sorted(days)[i:i + 500], dtype = 'datetime64[D]')
+                bounds = chunk[[0, -1]] + [0, 1]
+                if self.dialect == 'mssql':
+                    params = bounds.astype('datetime64[ms]').astype(object).tolist() + chunk.astype(object).tolist()
+                else:
+                    params = np.datetime_as_string(np.concatenate([bounds, chunk])).tolist()
+                delete = 'DELETE FROM {} WHERE {} >= ? AND {} < ? AND {} IN ({})'.format(
+                    table(ticker, self.dialect),
+                    quote('ticktime'),
+                    quote('ticktime'),
+                    trade_date,
+                    ', '.join('?' * len(chunk))
+                    )
+                deletes.append((delete, params))
+            cursor = self.cnxn.cursor()
+            if self.dialect == 'mssql':
+                cursor.fast_executemany = True
+            try:
+                for delete, params in deletes:
+                    cursor.execute(delete, params)
+                if len(columns['ticktime']):
+                    cursor.executemany(insert, self.params(columns))
+                if self.track:
+                    covered = [(day, len(days[day]['ticktime']), self.complete[(ticker, day)]) for day in sorted(days)]
+                    set_coverage(cursor, ticker, covered, self.dialect)
+                if self.rollup:
+                    write_rollups(cursor, ticker, sorted(days), columns, self.dialect)
+                self.cnxn.commit()
+            except Exception:
+                self.cnxn.rollback()
+                raise
+            finally:
+                cursor.close()
+        self.buffers = {}
+        self.complete = {}
+        self.rows = 0
+
+if __name__ == '__main__':
+
+    # check the daily bars the database aggregates against the
+    # ones aggregated here, on simulated ticks (w/ some ambiguous
+    # flags) in a SQLite stand-in for the tick tables
+    import sqlite3
+    from simulate import Simulation
+    from ticks import compact, daily_bars
+    sim = Simulation(0.3, 0.4, 200, 300, 250, days = 30, ambiguous = 0.05)
+    raw = pd.concat(list(sim.chunks()), ignore_index = True)
+    raw['ticktime'] = raw['ticktime'].values.astype('datetime64[s]')
+    for name, kind in schema:
+        if name not in raw.columns:
+            raw[name] = 0
+    days = raw['ticktime'].values.astype('datetime64[D]')
+    cnxn = sqlite3.connect(':memory:')
+    create_table(cnxn, 'TEST3', 'sqlite')
+    writer = BulkWriter(cnxn, 'sqlite', batch_rows = 10000)
+    for day in np.unique(days):
+        writer.add('TEST3', day.astype(object), raw[days == day])
+    writer.flush()
+    first, last = str(days[0]), str(days[-1])
+    expected = daily_bars(compact(raw, drop = False))
+    bars = read_daily_bars(cnxn, 'TEST3', first, last, 'sqlite')
+    assert bars.equals(expected), 'daily bars differ'
+
+    # writing days again replaces them, however often it's done:
+    # rewrite every other day (w/ half its ticks), twice; the
+    # days in between must stay as they were
+    unique = np.unique(days)
+    kept = np.ones(len(raw), dtype = bool)
+    for i in range(2):
+        for day in unique[::2]:
+            ticks = raw[days == day]
+            kept[np.flatnonzero(days == day)[len(ticks) // 2:]] = False
+            writer.add('TEST3', day.astype(object), ticks[:len(ticks) // 2])
+        writer.flush()
+    n = cnxn.execute('SELECT COUNT(*) FROM "TEST3"').fetchone()[0]
+    assert n == kept.sum(), 'expected {} ticks, found {}'.format(kept.sum(), n)
+    expected = daily_bars(compact(raw[kept], drop = False))
+    bars = read_daily_bars(cnxn, 'TEST3', first, last, 'sqlite')
+    assert bars.equals(expected), 'rewritten days differ'
+    print('ok')
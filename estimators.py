@@ -0,0 +1,619 @@
+import numpy as np
+from scipy.optimize import minimize
+from scipy.cluster.hierarchy import linkage, fcluster
+
+# order of the estimates, same as InfoTrad's output
+columns = [
+    'alpha',
+    'delta',
+    'mu',
+    'epsilon_b',
+    'epsilon_s',
+    'likelihood',
+    'PIN',
+    ]
+
+# keep parameters inside the open parameter space
+tiny = 1e-10
+bounds = [(tiny, 1 - tiny), (tiny, 1 - tiny), (tiny, None), (tiny, None), (tiny, None)]
+
+# bump when a change here changes the estimates, so that
+# estimates cached or checkpointed by earlier versions are redone
+version = 2
+
+# L-BFGS-B stopping rules; scipy's defaults stop short of the
+# optimum on likelihoods this large
+options = {'ftol': 1e-14, 'gtol': 1e-9, 'maxiter': 10000}
+
+def loglik(params, B, S, likelihood = 'LK', mask = None):
+    '''
+    factorized log-likelihood of the EKOP model
+
+    params is (..., 5) = alpha, delta, mu, epsilon_b, epsilon_s
+    and B, S are (..., days) daily buy and sell counts; leading
+    dimensions broadcast, so one call can evaluate many parameter
+    vectors against many series; mask (same shape as B) flags the
+    days that count, for padded series
+
+    'LK' is the Lin & Ke (2011) factorization, which subtracts the
+    largest exponent before exponentiating; 'EHO' is the Easley,
+    Hvidkjaer & O'Hara (2010) factorization, which doesn't, and
+    therefore overflows to inf on heavily traded stocks (as in
+    pin_gan_eho_estimates.csv); like InfoTrad, the constant log(B!S!)
+    terms are left out
+    '''
+    params = np.asarray(params, dtype = float)
+    alpha, delta, mu, eb, es = [params[..., k, None] for k in range(5)]
+    B = np.asarray(B, dtype = float)
+    S = np.asarray(S, dtype = float)
+    M = np.minimum(B, S) + np.maximum(B, S) / 2
+    lxb = np.log(eb) - np.log(mu + eb)
+    lxs = np.log(es) - np.log(mu + es)
+    e1 = -mu - M * lxb + (S - M) * lxs # good news
+    e2 = -mu + (B - M) * lxb - M * lxs # bad news
+    e3 = (B - M) * lxb + (S - M) * lxs # no news
+    common = -eb - es + M * (lxb + lxs) + B * np.log(mu + eb) + S * np.log(mu + es)
+    with np.errstate(over = 'ignore', divide = 'ignore'):
+        if likelihood == 'LK':
+            emax = np.maximum(np.maximum(e1, e2), e3)
+            ll = common + emax + np.log(
+                alpha * (1 - delta) * np.exp(e1 - emax)
+                + alpha * delta * np.exp(e2 - emax)
+                + (1 - alpha) * np.exp(e3 - emax)
+                )
+        elif likelihood == 'EHO':
+            ll = common + np.log(
+                alpha * (1 - delta) * np.exp(e1)
+                + alpha * delta * np.exp(e2)
+                + (1 - alpha) * np.exp(e3)
+                )
+        else:
+            raise ValueError('unknown likelihood: {}'.format(likelihood))
+    if mask is not None:
+        ll = np.where(mask, ll, 0)
+    return ll.sum(axis = -1)
+
+def gradient(params, B, S, mask = None):
+    '''
+    analytic gradient of loglik() at params, (5,), w/ each day's
+    news states weighted by their posteriors (same for either
+    factorization, which differ only numerically)
+    '''
+    alpha, delta, mu, eb, es = params
+    B = np.asarray(B, dtype = float)
+    S = np.asarray(S, dtype = float)
+    if mask is not None:
+        B, S = B[mask], S[mask]
+    n = len(B)
+    M = np.minimum(B, S) + np.maximum(B, S) / 2
+    Bm, Sm = B - M, S - M
+    lxb = np.log(eb) - np.log(mu + eb)
+    lxs = np.log(es) - np.log(mu + es)
+    e = np.stack([
+        -mu - M * lxb + Sm * lxs,
+        -mu + Bm * lxb - M * lxs,
+        Bm * lxb + Sm * lxs,
+        ])
+    E = np.exp(e - e.max(axis = 0))
+    prior = np.array([alpha * (1 - delta), alpha * delta, 1 - alpha])[:, None]
+    Z = (prior * E).sum(axis = 0)
+    r1, r2, r3 = prior * E / Z # posteriors of good, bad, no news
+    cb = M.sum() + (Bm * (r2 + r3) - M * r1).sum() # d/d lxb
+    cs = M.sum() + (Sm * (r1 + r3) - M * r2).sum() # d/d lxs
+    return np.array([
+        (((1 - delta) * E[0] + delta * E[1] - E[2]) / Z).sum(),
+        (alpha * (E[1] - E[0]) / Z).sum(),
+        -(r1 + r2).sum() + (B.sum() - cb) / (mu + eb) + (S.sum() - cs) / (mu + es),
+        -n + cb * (1 / eb - 1 / (mu + eb)) + B.sum() / (mu + eb),
+        -n + cs * (1 / es - 1 / (mu + es)) + S.sum() / (mu + es),
+        ])
+
+def cluster_initials(B, S, clusters):
+    '''
+    initial values from a partition of days into news/no-news days
+
+    clusters is a list of (good, bad) boolean day masks; days in
+    neither are no-news days
+    '''
+    initials = []
+    n = len(B)
+    for good, bad in clusters:
+        none = ~(good | bad)
+        n_good, n_bad = good.sum(), bad.sum()
+        alpha = (n_good + n_bad) / n
+        delta = n_bad / (n_good + n_bad) if n_good + n_bad else 0.5
+        eb = B[none | bad].mean() if (none | bad).any() else B.mean()
+        es = S[none | good].mean() if (none | good).any() else S.mean()
+        mu_b = B[good].mean() - eb if n_good else 0
+        mu_s = S[bad].mean() - es if n_bad else 0
+        if n_good + n_bad:
+            mu = (n_good * mu_b + n_bad * mu_s) / (n_good + n_bad)
+        else:
+            mu = 0
+        initials.append([alpha, delta, mu, eb, es])
+    initials = np.array(initials, dtype = float)
+    lower = [b[0] for b in bounds]
+    upper = [b[1] if b[1] is not None else np.inf for b in bounds]
+    initials = np.clip(initials, lower, upper)
+    return initials
+
+def hac(OI, k):
+    '''
+    complete-linkage hierarchical clustering of daily order
+    imbalances (R's hclust default), labels sorted by cluster mean
+    '''
+    k = min(k, len(OI))
+    labels = fcluster(linkage(OI.reshape(-1, 1), method = 'complete'), k, criterion = 'maxclust')
+    means = {label: OI[labels == label].mean() for label in set(labels)}
+    order = sorted(means, key = lambda label: means[label])
+    return np.array([order.index(label) for label in labels]), [means[label] for label in order]
+
+def gan_initials(B, S):
+    '''
+    Gan, Wei & Johnstone (2015): three clusters of order imbalance;
+    lowest mean is bad news, highest is good news
+    '''
+    B = np.asarray(B, dtype = float)
+    S = np.asarray(S, dtype = float)
+    if len(B) < 3:
+        return cluster_initials(B, S, [(np.zeros(len(B), bool), np.zeros(len(B), bool))])
+    labels, means = hac(B - S, 3)
+    top = labels.max()
+    return cluster_initials(B, S, [(labels == top, labels == 0)])
+
+def ea_initials(B, S, k = 6):
+    '''
+    Ersan & Alici (2016): k clusters of order imbalance; for
+    j = 1, ..., k - 1, the j clusters with the largest absolute mean
+    imbalance are news days (good if positive, bad if negative);
+    each j gives one set of initial values
+    '''
+    B = np.asarray(B, dtype = float)
+    S = np.asarray(S, dtype = float)
+    if len(B) < 3:
+        return gan_initials(B, S)
+    labels, means = hac(B - S, k)
+    ranked = sorted(range(len(means)), key = lambda c: -abs(means[c]))
+    clusters = []
+    for j in range(1, len(means)):
+        news = ranked[:j]
+        good = np.isin(labels, [c for c in news if means[c] > 0])
+        bad = np.isin(labels, [c for c in news if means[c] <= 0])
+        clusters.append((good, bad))
+    return cluster_initials(B, S, clusters)
+
+initializers = {
+    'GAN': gan_initials,
+    'EA': ea_initials,
+    }
+
+def optimize(start, B, S, likelihood = 'LK'):
+    '''
+    maximize the likelihood from one set of initial values (w/
+    the analytic gradient); returns (params, loglik)
+    '''
+    B = np.asarray(B, dtype = float)
+    S = np.asarray(S, dtype = float)
+    f = lambda p: -loglik(p, B, S, likelihood)
+    jac = lambda p: -gradient(p, B, S)
+    with np.errstate(invalid = 'ignore', over = 'ignore', divide = 'ignore'):
+        res = minimize(f, start, jac = jac, method = 'L-BFGS-B', bounds = bounds, options = options)
+    return res.x, loglik(res.x, B, S, likelihood)
+
+def pin(params):
+    alpha, delta, mu, eb, es = params
+    return alpha * mu / (alpha * mu + eb + es)
+
+def estimate(B, S, method = 'GAN', likelihood = 'LK'):
+    '''
+    estimate the EKOP model from daily buy and sell counts;
+    method picks the initial values ('GAN' or 'EA'), likelihood
+    the factorization ('LK' or 'EHO'); returns a list in the
+    order of `columns`, like InfoTrad's GAN() and EA()
+    '''
+    B = np.asarray(B, dtype = float)
+    S = np.asarray(S, dtype = float)
+    best = None
+    for start in initializers[method](B, S):
+        params, ll = optimize(start, B, S, likelihood)
+        if (best is None) or (ll > best[1]):
+            best = (params, ll)
+    params, ll = best
+    return list(params) + [ll, pin(params)]
+
+def stack(series):
+    '''
+    stack many (B, S) daily series into padded (series, days) arrays;
+    returns B, S and a mask that flags the real (non-padding) days
+    '''
+    days = max(len(B) for B, S in series)
+    B = np.zeros((len(series), days))
+    S = np.zeros((len(series), days))
+    mask = np.zeros((len(series), days), dtype = bool)
+    for i, (b, s) in enumerate(series):
+        B[i, :len(b)] = b
+        S[i, :len(s)] = s
+        mask[i, :len(b)] = True
+    return B, S, mask
+
+def estimate_batch(series, method = 'GAN', likelihood = 'LK', n_best = None):
+    '''
+    estimate the EKOP model for many stock-quarters at once
+
+    series is a list of (B, S) daily buy and sell counts; the
+    likelihood of every initial-value candidate of every series is
+    evaluated in a single broadcasted pass over the padded arrays,
+    and the candidates of each series are then optimized, most
+    likely first (all of them, as estimate() does, unless n_best
+    caps how many); returns a list of estimates (in the order of
+    `columns`), with None where the optimization failed or the
+    series is empty
+    '''
+    if len(series) == 0:
+        return []
+    keep = [i for i, (b, s) in enumerate(series) if len(b)]
+    if len(keep) < len(series):
+        all_estimates = [None] * len(series)
+        for i, e in zip(keep, estimate_batch([series[i] for i in keep], method, likelihood, n_best)):
+            all_estimates[i] = e
+        return all_estimates
+    B, S, mask = stack(series)
+
+    # initial-value candidates, padded by repeating the first one
+    initials = [initializers[method](np.asarray(b, dtype = float), np.asarray(s, dtype = float)) for b, s in series]
+    k = max(len(c) for c in initials)
+    candidates = np.stack([np.concatenate([c, np.repeat(c[:1], k - len(c), axis = 0)]) for c in initials])
+
+    # (series, candidates) likelihoods in one pass
+    with np.errstate(invalid = 'ignore'):
+        ll = loglik(candidates, B[:, None, :], S[:, None, :], likelihood, mask[:, None, :])
+    ll = np.where(np.isnan(ll), -np.inf, ll)
+    order = np.argsort(-ll, axis = 1, kind = 'stable')
+
+    # optimize the best starts only
+    all_estimates = []
+    for i, (b, s) in enumerate(series):
+        best = None
+        for j in order[i, :min(n_best or len(initials[i]), len(initials[i]))]:
+            try:
+                params, value = optimize(candidates[i, j], b, s, likelihood)
+            except Exception:
+                continue
+            if (best is None) or (value > best[1]):
+                best = (params, value)
+        if best is None:
+            all_estimates.append(None)
+        else:
+            params, value = best
+            all_estimates.append(list(params) + [value, pin(params)])
+    return all_estimates
+
+def em_step(params, B, S, mask):
+    '''
+    one expectation-maximization step for many series at once
+
+    E-step: posterior probabilities of good news, bad news and no
+    news on each day, in log space (the terms every state shares
+    factored out, the largest exponent subtracted); M-step: closed
+    form, splitting buys on good-news days (sells on bad-news days)
+    into uninformed and informed ones in proportion to the arrival
+    rates; params is (series, 5), B, S and mask (series, days);
+    returns the new params and the log-likelihood of the old ones
+    (same as loglik's)
+    '''
+    alpha, delta, mu, eb, es = [params[:, k, None] for k in range(5)]
+    lb = np.log(mu + eb) - np.log(eb)
+    ls = np.log(mu + es) - np.log(es)
+    lg = np.log(alpha * (1 - delta)) - mu + B * lb # good news
+    lx = np.log(alpha * delta) - mu + S * ls # bad news
+    ln = np.log(1 - alpha) + np.zeros_like(B) # no news
+    lmax = np.maximum(np.maximum(lg, lx), ln)
+    wg, wx, wn = np.exp(lg - lmax), np.exp(lx - lmax), np.exp(ln - lmax)
+    total = wg + wx + wn
+    common = -eb - es + B * np.log(eb) + S * np.log(es)
+    ll = np.where(mask, common + lmax + np.log(total), 0).sum(axis = 1)
+    wg, wx, wn = [np.where(mask, w / total, 0) for w in (wg, wx, wn)]
+
+    # expected counts
+    days = mask.sum(axis = 1)
+    news = wg.sum(axis = 1) + wx.sum(axis = 1)
+    share_b = (eb / (eb + mu))[:, 0]
+    share_s = (es / (es + mu))[:, 0]
+    good_B = (wg * B).sum(axis = 1)
+    bad_S = (wx * S).sum(axis = 1)
+    other_B = ((wn + wx) * B).sum(axis = 1)
+    other_S = ((wn + wg) * S).sum(axis = 1)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        new = np.stack([
+            news / days,
+            np.where(news > 0, wx.sum(axis = 1) / news, delta[:, 0]),
+            np.where(news > 0, (good_B * (1 - share_b) + bad_S * (1 - share_s)) / news, mu[:, 0]),
+            (other_B + good_B * share_b) / days,
+            (other_S + bad_S * share_s) / days,
+            ], axis = 1)
+    lower = [b[0] for b in bounds]
+    upper = [b[1] if b[1] is not None else np.inf for b in bounds]
+    return np.clip(new, lower, upper), ll
+
+def em(start, B, S, mask, tol = 1e-8, max_iter = 1000):
+    '''
+    expectation-maximization from start (series, 5) until the
+    log-likelihood of each series improves by less than tol
+    (relative) or max_iter steps; converged series stop being
+    updated; returns params, log-likelihoods, iterations and
+    whether each series converged
+    '''
+    params = np.array(start, dtype = float)
+    ll = np.full(len(params), -np.inf)
+    iterations = np.zeros(len(params), dtype = int)
+    converged = np.zeros(len(params), dtype = bool)
+    active = np.arange(len(params))
+    for i in range(max_iter):
+        new, value = em_step(params[active], B[active], S[active], mask[active])
+        done = np.abs(value - ll[active]) <= tol * (1 + np.abs(value))
+        ll[active] = value
+        converged[active[done]] = True
+        params[active[~done]] = new[~done]
+        iterations[active[~done]] += 1
+        active = active[~done]
+        if len(active) == 0:
+            break
+    return params, ll, iterations, converged
+
+def estimate_em(series, method = 'GAN', likelihood = 'LK', n_best = None, tol = 1e-8, max_iter = 1000):
+    '''
+    like estimate_batch, but maximizing the likelihood by
+    expectation-maximization instead of L-BFGS-B, for all series
+    (and all initial values of each, or the n_best most likely)
+    at once; the
+    likelihood reported is the requested factorization's;
+    returns the estimates, plus the EM iterations of each and
+    whether they converged (None, 0 and False for empty series)
+    '''
+    if len(series) == 0:
+        return [], [], []
+    keep = [i for i, (b, s) in enumerate(series) if len(b)]
+    if len(keep) < len(series):
+        all_estimates, iterations, converged = [None] * len(series), [0] * len(series), [False] * len(series)
+        results = estimate_em([series[i] for i in keep], method, likelihood, n_best, tol, max_iter)
+        for i, e, n, ok in zip(keep, *results):
+            all_estimates[i], iterations[i], converged[i] = e, n, ok
+        return all_estimates, iterations, converged
+    B, S, mask = stack(series)
+
+    # initial-value candidates, as in estimate_batch
+    initials = [initializers[method](np.asarray(b, dtype = float), np.asarray(s, dtype = float)) for b, s in series]
+    k = max(len(c) for c in initials)
+    candidates = np.stack([np.concatenate([c, np.repeat(c[:1], k - len(c), axis = 0)]) for c in initials])
+    with np.errstate(invalid = 'ignore'):
+        ll = loglik(candidates, B[:, None, :], S[:, None, :], 'LK', mask[:, None, :])
+    ll = np.where(np.isnan(ll), -np.inf, ll)
+    order = np.argsort(-ll, axis = 1, kind = 'stable')[:, :n_best]
+
+    # EM on every (series, start) pair
+    rows = np.repeat(np.arange(len(series)), order.shape[1])
+    starts = candidates[rows, order.ravel()]
+    with np.errstate(invalid = 'ignore', divide = 'ignore', over = 'ignore'):
+        params, ll, iterations, converged = em(starts, B[rows], S[rows], mask[rows], tol, max_iter)
+    ll = np.where(np.isfinite(ll), ll, -np.inf).reshape(order.shape)
+    best = rows.reshape(order.shape)[:, 0] * order.shape[1] + np.argmax(ll, axis = 1)
+
+    all_estimates = []
+    for i, j in enumerate(best):
+        if not np.isfinite(ll.ravel()[j]):
+            all_estimates.append(None)
+            continue
+        b, s = B[i][mask[i]], S[i][mask[i]]
+        with np.errstate(invalid = 'ignore'):
+            value = loglik(params[j], b, s, likelihood)
+        all_estimates.append(list(params[j]) + [value, pin(params[j])])
+    return all_estimates, list(iterations[best]), list(converged[best])
+
+class RollingLikelihood:
+    '''
+    log-likelihood of the EKOP model over a sliding window of
+    days, updated incrementally: the per-day terms that don't
+    depend on the parameters (M, B - M, S - M) are computed once,
+    when a day enters the window, and the sums of B, S and M that
+    make up the no-mixture part of the likelihood are kept as
+    running totals, adjusted as days enter and leave
+
+    same value as loglik() on the window's days
+    '''
+
+    def __init__(self, window, likelihood = 'LK'):
+        if likelihood not in ('LK', 'EHO'):
+            raise ValueError('unknown likelihood: {}'.format(likelihood))
+        self.window = window
+        self.likelihood = likelihood
+        self.B = np.zeros(window)
+        self.S = np.zeros(window)
+        self.M = np.zeros(window)
+        self.Bm = np.zeros(window) # B - M
+        self.Sm = np.zeros(window) # S - M
+        self.head = 0
+        self.count = 0
+        self.sum_B = 0.0
+        self.sum_S = 0.0
+        self.sum_M = 0.0
+
+    def push(self, b, s):
+        '''
+        add a day to the window (dropping the oldest if full)
+        '''
+        i = self.head
+        if self.count == self.window:
+            self.sum_B -= self.B[i]
+            self.sum_S -= self.S[i]
+            self.sum_M -= self.M[i]
+        else:
+            self.count += 1
+        m = min(b, s) + max(b, s) / 2
+        self.B[i], self.S[i], self.M[i] = b, s, m
+        self.Bm[i], self.Sm[i] = b - m, s - m
+        self.sum_B += b
+        self.sum_S += s
+        self.sum_M += m
+        self.head = (i + 1) % self.window
+
+    def days(self):
+        '''
+        the window's B and S, oldest day first
+        '''
+        if self.count < self.window:
+            return self.B[:self.count].copy(), self.S[:self.count].copy()
+        return np.roll(self.B, -self.head), np.roll(self.S, -self.head)
+
+    def __call__(self, params):
+        '''
+        log-likelihood of params, (..., 5), over the window
+        '''
+        params = np.asarray(params, dtype = float)
+        alpha, delta, mu, eb, es = [params[..., k, None] for k in range(5)]
+        n = self.count
+        M, Bm, Sm = self.M[:n], self.Bm[:n], self.Sm[:n]
+        lxb = np.log(eb) - np.log(mu + eb)
+        lxs = np.log(es) - np.log(mu + es)
+        common = (
+            n * (-eb - es)
+            + self.sum_M * (lxb + lxs)
+            + self.sum_B * np.log(mu + eb)
+            + self.sum_S * np.log(mu + es)
+            )[..., 0]
+        e1 = -mu - M * lxb + Sm * lxs # good news
+        e2 = -mu + Bm * lxb - M * lxs # bad news
+        e3 = Bm * lxb + Sm * lxs # no news
+        with np.errstate(over = 'ignore', divide = 'ignore'):
+            if self.likelihood == 'LK':
+                emax = np.maximum(np.maximum(e1, e2), e3)
+                mixture = emax + np.log(
+                    alpha * (1 - delta) * np.exp(e1 - emax)
+                    + alpha * delta * np.exp(e2 - emax)
+                    + (1 - alpha) * np.exp(e3 - emax)
+                    )
+            else:
+                mixture = np.log(
+                    alpha * (1 - delta) * np.exp(e1)
+                    + alpha * delta * np.exp(e2)
+                    + (1 - alpha) * np.exp(e3)
+                    )
+        return common + mixture.sum(axis = -1)
+
+    def gradient(self, params):
+        '''
+        analytic gradient of the log-likelihood at params, (5,)
+        '''
+        return gradient(params, self.B[:self.count], self.S[:self.count])
+
+    def optimize(self, start):
+        '''
+        maximize the window's likelihood from start (w/ the
+        analytic gradient); returns (params, loglik, converged)
+        '''
+        f = lambda p: -self(p)
+        jac = lambda p: -self.gradient(p)
+        with np.errstate(invalid = 'ignore', over = 'ignore', divide = 'ignore'):
+            res = minimize(f, start, jac = jac, method = 'L-BFGS-B', bounds = bounds, options = options)
+        return res.x, self(res.x), res.success
+
+def estimate_rolling(B, S, window = 60, step = 1, method = 'GAN', likelihood = 'LK', refresh = None):
+    '''
+    estimate the EKOP model on a sliding window of `window` days,
+    moved `step` days at a time, over daily buy and sell counts
+
+    each window is optimized once, starting from the previous
+    window's optimum (the windows overlap, so it's usually close);
+    the fit is deemed degraded, and the window re-estimated from
+    every initial value of `method` as in estimate(), if that
+    optimization fails, if one of those initial values is already
+    more likely than its optimum (i.e., the warm start is stuck in
+    a worse local maximum) or if `refresh` windows (default: one
+    window's worth of steps) went by since the last full estimation
+
+    returns a list of (index of the window's last day, estimate,
+    warm), estimate in the order of `columns` (None if every
+    optimization failed) and warm True where the warm start was kept
+    '''
+    B = np.asarray(B, dtype = float)
+    S = np.asarray(S, dtype = float)
+    if refresh is None:
+        refresh = max(1, window // step)
+    lik = RollingLikelihood(window, likelihood)
+    estimates = []
+    previous = None
+    since = 0
+    for i in range(len(B)):
+        lik.push(B[i], S[i])
+        if (i + 1 < window) or ((i + 1 - window) % step):
+            continue
+        b, s = lik.days()
+        initials = initializers[method](b, s)
+        best = None
+        warm = False
+        if (previous is not None) and (since < refresh):
+            try:
+                params, value, converged = lik.optimize(previous)
+            except Exception:
+                converged = False
+            if converged and np.isfinite(value):
+                with np.errstate(invalid = 'ignore'):
+                    cold = lik(initials)
+                if not (np.nan_to_num(cold, nan = -np.inf) > value).any():
+                    best = (params, value)
+                    warm = True
+        if best is None:
+            since = 0
+            for start in initials:
+                try:
+                    params, value, converged = lik.optimize(start)
+                except Exception:
+                    continue
+                if not np.isfinite(value) and likelihood == 'LK':
+                    continue
+                if (best is None) or (value > best[1]):
+                    best = (params, value)
+        since += 1
+        if best is None:
+            previous = None
+            estimates.append((i, None, False))
+            continue
+        params, value = best
+        previous = params
+        estimates.append((i, list(params) + [value, pin(params)], warm))
+    return estimates
+
+if __name__ == '__main__':
+
+    # check the optimizer on simulated quarters: the analytic
+    # gradient must match finite differences, and L-BFGS-B must
+    # get as high as EM (run to a much tighter tolerance) does
+    # from the same initial values
+    from simulate import Simulation
+    rng = np.random.default_rng(0)
+    short = 0
+    for i in range(40):
+        eb = 10 ** rng.uniform(1, 3.5)
+        sim = Simulation(
+            rng.uniform(0.05, 0.6),
+            rng.uniform(0.1, 0.9),
+            eb * rng.uniform(0.1, 2),
+            eb,
+            eb * rng.uniform(0.5, 1.5),
+            days = 60,
+            seed = i
+            )
+        B, S = sim.B.astype(float), sim.S.astype(float)
+        p = sim.params
+        h = np.array([1e-6, 1e-6, 1e-4, 1e-4, 1e-4])
+        numeric = [(loglik(p + e, B, S) - loglik(p - e, B, S)) / (2 * e[k]) for k, e in enumerate(np.diag(h))]
+        assert np.allclose(gradient(p, B, S), numeric, rtol = 1e-4, atol = 1e-3)
+        starts = gan_initials(B, S)
+        lbfgs = max(optimize(start, B, S)[1] for start in starts)
+        mask = np.ones((len(starts), len(B)), dtype = bool)
+        with np.errstate(invalid = 'ignore', divide = 'ignore', over = 'ignore'):
+            params, ll, iterations, converged = em(starts, np.tile(B, (len(starts), 1)), np.tile(S, (len(starts), 1)), mask, 1e-14, 100000)
+        if lbfgs < np.nanmax(ll) - 0.01:
+            short += 1
+            print('quarter', i, 'L-BFGS-B short by', np.nanmax(ll) - lbfgs)
+    assert short == 0
+    print('ok')
@@ -0,0 +1,135 @@
+'''
+stand-in for the MetaTrader5 package that serves synthetic
+trade ticks, for running the ingestion w/o a terminal (and
+w/o hitting the broker): import fake_mt5 as mt5
+
+ticks are deterministic (same symbol and day, same ticks), on
+weekdays, 10:00 to 18:00; a request for more than `limit` ticks
+fails, like the terminal does when a range is too big
+'''
+import sys
+import zlib
+import numpy as np
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+COPY_TICKS_ALL = -1
+COPY_TICKS_INFO = 1
+COPY_TICKS_TRADE = 2
+
+TICK_FLAG_BID = 2
+TICK_FLAG_ASK = 4
+TICK_FLAG_LAST = 8
+TICK_FLAG_VOLUME = 16
+TICK_FLAG_BUY = 32
+TICK_FLAG_SELL = 64
+
+RES_S_OK = 1
+RES_E_NO_MEMORY = -3
+
+tick_dtype = np.dtype([
+    ('time', '<i8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+    ('last', '<f8'),
+    ('volume', '<u8'),
+    ('time_msc', '<i8'),
+    ('flags', '<u4'),
+    ('volume_real', '<f8'),
+    ])
+
+SymbolInfo = namedtuple('SymbolInfo', ['name'])
+
+# settings
+symbols = ['PETR4', 'VALE3', 'MTSA4', 'ABCD3', 'PETR4F', 'WINJ21']
+ticks_per_day = 2000
+limit = 100000
+
+# what was asked, for inspection
+calls = []
+error = (RES_S_OK, 'Success')
+
+def initialize(*args, **kwargs):
+    return True
+
+def shutdown():
+    return None
+
+def terminal_info():
+    return 'fake_mt5'
+
+def version():
+    return (500, 0, 'fake')
+
+def last_error():
+    return error
+
+def symbols_get(*args, **kwargs):
+    return tuple(SymbolInfo(name) for name in symbols)
+
+def day_ticks(symbol, day):
+    '''
+    a day's synthetic ticks (empty on weekends)
+    '''
+    if day.weekday() >= 5:
+        return np.zeros(0, dtype = tick_dtype)
+    rng = np.random.default_rng(zlib.crc32('{}{}'.format(symbol, day).encode()))
+    n = rng.poisson(ticks_per_day * rng.uniform(0.5, 1.5))
+    open_ms = int((datetime(day.year, day.month, day.day, 10) - datetime(1970, 1, 1)).total_seconds()) * 1000
+    time_msc = np.sort(open_ms + rng.integers(0, 8 * 3600 * 1000, n))
+    price = np.round(20 * np.exp(np.cumsum(rng.normal(0, 1e-3, n))), 2)
+    side = rng.choice([TICK_FLAG_BUY, TICK_FLAG_SELL, TICK_FLAG_BUY | TICK_FLAG_SELL, 0], n, p = [0.48, 0.48, 0.02, 0.02])
+    volume = 100 * rng.geometric(0.3, n)
+    ticks = np.zeros(n, dtype = tick_dtype)
+    ticks['time'] = time_msc // 1000
+    ticks['bid'] = price - 0.01
+    ticks['ask'] = price + 0.01
+    ticks['last'] = price
+    ticks['volume'] = volume
+    ticks['time_msc'] = time_msc
+    ticks['flags'] = TICK_FLAG_LAST | TICK_FLAG_VOLUME | side
+    ticks['volume_real'] = volume
+    return ticks
+
+def copy_ticks_range(symbol, date_from, date_to, flags):
+    '''
+    ticks between date_from and date_to (inclusive, to the second),
+    or None (see last_error()) if there are more than `limit`
+    '''
+    global error
+    calls.append((symbol, date_from, date_to, flags))
+    if symbol not in symbols:
+        error = (-1, 'Unknown symbol')
+        return None
+    days = []
+    day = date_from.date()
+    while day <= date_to.date():
+        days.append(day_ticks(symbol, day))
+        day += timedelta(days = 1)
+    ticks = np.concatenate(days) if days else np.zeros(0, dtype = tick_dtype)
+    lo = (date_from - datetime(1970, 1, 1)).total_seconds()
+    hi = (date_to - datetime(1970, 1, 1)).total_seconds()
+    ticks = ticks[(ticks['time'] >= lo) & (ticks['time'] <= hi)]
+    if len(ticks) > limit:
+        error = (RES_E_NO_MEMORY, 'No memory')
+        return None
+    error = (RES_S_OK, 'Success')
+    return ticks
+
+if __name__ == '__main__':
+
+    # check the ingestion against this stand-in: w/ a limit
+    # smaller than some 2-day ranges, every day must still come
+    # back, split down to single days where needed
+    from ingest import fetch, split_days, TokenBucket
+    limit = 3000
+    limiter = TokenBucket(rate = 1e9, capacity = 1e9)
+    t0 = datetime(2020, 1, 7)
+    t1 = datetime(2020, 1, 8, 23, 59, 59)
+    days = []
+    for a, b, ticks in fetch(sys.modules[__name__], 'PETR4', t0, t1, limiter, max_ticks = 5000000):
+        days += split_days(ticks, a, b)
+    for day, ticks in days:
+        assert ticks is not None, 'failed: {}'.format(day)
+        assert (ticks == day_ticks('PETR4', day)).all()
+    print(len(calls), 'requests,', [(str(day), len(ticks)) for day, ticks in days])
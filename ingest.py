@@ -0,0 +1,167 @@
+import time
+import queue
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+# tick table columns, in MetaTrader 5's order
+names = [
+    'ticktime',
+    'bid',
+    'ask',
+    'last',
+    'volume',
+    'time_msc',
+    'flags',
+    'volume_real'
+    ]
+
+class TokenBucket:
+    '''
+    rate limiter: up to `capacity` requests in a burst, refilled
+    at `rate` requests per second; acquire() blocks until a
+    request is allowed (thread-safe)
+    '''
+
+    def __init__(self, rate, capacity = 1, clock = time.monotonic, sleep = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                self.sleep((1 - self.tokens) / self.rate)
+
+def to_frame(ticks):
+    '''
+    MetaTrader 5 ticks (a structured array) -> tick table rows
+    '''
+    ticks = pd.DataFrame(ticks)
+    if len(ticks) == 0:
+        return pd.DataFrame(columns = names)
+    ticks['time'] = pd.to_datetime(ticks['time'], unit = 's')
+    ticks.columns = names
+    return ticks
+
+def split_days(ticks, t0, t1):
+    '''
+    ticks of [t0, t1] -> (date, ticks) for every calendar day
+    in the range, days w/o ticks included
+    '''
+    days = pd.date_range(t0.date(), t1.date(), freq = 'D')
+    if ticks is None:
+        return [(day.date(), None) for day in days]
+    day_of = ticks['time'] // 86400
+    first = (days.values.astype('datetime64[D]').astype(np.int64))
+    bounds = np.searchsorted(day_of, np.append(first, first[-1] + 1))
+    return [(day.date(), ticks[bounds[k]:bounds[k + 1]]) for k, day in enumerate(days)]
+
+def fetch(mt5, ticker, t0, t1, limiter, max_ticks, min_span = timedelta(days = 1)):
+    '''
+    request the ticks of [t0, t1] (inclusive, to the second);
+    a range that fails or comes back w/ max_ticks or more ticks
+    (i.e., maybe truncated) is split in half and each half
+    requested in turn, down to ranges shorter than min_span
+    (ranges are inclusive, so a day is 23:59:59 long); returns
+    a list of (t0, t1, ticks), ticks None where even that failed
+    '''
+    limiter.acquire()
+    ticks = mt5.copy_ticks_range(ticker, t0, t1, mt5.COPY_TICKS_TRADE)
+    if (ticks is not None) and (len(ticks) < max_ticks):
+        return [(t0, t1, ticks)]
+    if t1 - t0 < min_span:
+        return [(t0, t1, ticks)]
+    mid = datetime.combine((t0 + (t1 - t0) / 2).date(), datetime.min.time())
+    if mid <= t0:
+        mid = t0 + min_span
+    left = fetch(mt5, ticker, t0, mid - timedelta(seconds = 1), limiter, max_ticks, min_span)
+    right = fetch(mt5, ticker, mid, t1, limiter, max_ticks, min_span)
+    return left + right
+
+def ranges(date_start, date_end, span):
+    '''
+    [date_start, date_end] in (t0, t1) chunks of `span` days
+    '''
+    t0 = datetime.combine(date_start, datetime.min.time())
+    end = datetime.combine(date_end, datetime.min.time()) + timedelta(days = 1)
+    while t0 < end:
+        t1 = min(t0 + timedelta(days = span), end)
+        yield t0, t1 - timedelta(seconds = 1)
+        t0 = t1
+
+def fetcher(mt5, tasks, out, limiter, span, max_ticks):
+    '''
+    producer: fetch each (ticker, date_start, date_end) task,
+    `span` days per request, and put (ticker, date, ticks) on
+    the `out` queue, one item per day, ticks None on failure
+    '''
+    for ticker, date_start, date_end in tasks:
+        for t0, t1 in ranges(date_start, date_end, span):
+            for a, b, ticks in fetch(mt5, ticker, t0, t1, limiter, max_ticks):
+                for date, day in split_days(ticks, a, b):
+                    out.put((ticker, date, day))
+
+def ingest(mt5, tasks, write, span = 30, max_ticks = 5000000, rate = 1 / 3, burst = 1, queue_size = 64):
+    '''
+    download ticks from MetaTrader 5 and hand them to `write`
+
+    a background thread fetches while the calling thread writes,
+    through a queue of at most queue_size days (so a slow writer
+    holds back the fetcher instead of filling up memory); tasks
+    are (ticker, first date, last date); write is called as
+    write(ticker, date, ticks), in order, ticks None if the
+    request failed and empty if there was no trading
+    '''
+    q = queue.Queue(maxsize = queue_size)
+    limiter = TokenBucket(rate, burst)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            fetcher(mt5, tasks, q, limiter, span, max_ticks)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            q.put(done)
+
+    thread = threading.Thread(target = produce, daemon = True)
+    thread.start()
+    while True:
+        item = q.get()
+        if item is done:
+            break
+        write(*item)
+    thread.join()
+    if errors:
+        raise errors[0]
+
+def missing(sessions, covered):
+    '''
+    runs of consecutive sessions (dates) that aren't covered,
+    as (first date, last date) pairs
+    '''
+    runs = []
+    previous = False
+    for day in sessions:
+        if day in covered:
+            previous = False
+            continue
+        if previous:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+        previous = True
+    return runs
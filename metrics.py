@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import contextlib
+import pandas as pd
+try:
+    import resource
+except ImportError:
+    resource = None # Windows (e.g., scrape_data.py w/ MetaTrader 5)
+
+# pipeline stages, in order
+stages = ['query', 'classify', 'aggregate', 'estimate', 'write']
+
+def peak_rss():
+    '''
+    this process's peak resident memory so far, in MB (None
+    where that isn't available)
+    '''
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        kb /= 1024 # bytes there
+    return kb / 1024
+
+class Metrics:
+    '''
+    per-stage run metrics, appended as JSON lines to path (one
+    line per stage per (ticker, period), plus status events such
+    as nodata or MemoryError); processes can share the file
+
+    hooks are called w/ every record, e.g. print
+    '''
+
+    def __init__(self, path, run = None, hooks = ()):
+        self.path = path
+        self.run = run or time.strftime('%Y%m%d-%H%M%S')
+        self.hooks = list(hooks)
+
+    def write(self, records):
+        if len(records) == 0:
+            return
+        with open(self.path, mode = 'a') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+        for hook in self.hooks:
+            for record in records:
+                hook(record)
+
+    def timer(self, ticker, period):
+        return Timer(self, ticker, period)
+
+    def event(self, ticker, period, status, **fields):
+        record = {
+            'run': self.run,
+            'pid': os.getpid(),
+            'ticker': ticker,
+            'period': period,
+            'stage': None,
+            'status': status,
+            'time': time.time(),
+            }
+        record.update(fields)
+        self.write([record])
+
+class Timer:
+    '''
+    accumulates wall time and rows by stage for one (ticker,
+    period), over any number of timed blocks (e.g. one per chunk
+    of ticks); flush() writes one record per stage
+    '''
+
+    def __init__(self, metrics, ticker, period):
+        self.metrics = metrics
+        self.ticker = ticker
+        self.period = period
+        self.seconds = {}
+        self.rows = {}
+        self.status = {}
+
+    @contextlib.contextmanager
+    def __call__(self, stage, rows = 0):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        except BaseException as e:
+            self.status[stage] = type(e).__name__
+            raise
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0) + time.perf_counter() - t0
+            self.rows[stage] = self.rows.get(stage, 0) + rows
+
+    def add_rows(self, stage, rows):
+        self.rows[stage] = self.rows.get(stage, 0) + rows
+
+    def flush(self):
+        records = []
+        for stage in self.seconds:
+            records.append({
+                'run': self.metrics.run,
+                'pid': os.getpid(),
+                'ticker': self.ticker,
+                'period': self.period,
+                'stage': stage,
+                'status': self.status.get(stage, 'ok'),
+                'seconds': self.seconds[stage],
+                'rows': self.rows[stage],
+                'peak_rss_mb': peak_rss(),
+                'time': time.time(),
+                })
+        self.metrics.write(records)
+        self.seconds, self.rows, self.status = {}, {}, {}
+
+def timed(timer, stage, rows = 0):
+    '''
+    timer(stage, rows), or nothing if there's no timer
+    '''
+    if timer is None:
+        return contextlib.nullcontext()
+    return timer(stage, rows)
+
+def read(path, run = None):
+    '''
+    the records in path (of one run, or of the latest one)
+    '''
+    records = pd.read_json(path, lines = True)
+    if len(records) == 0:
+        return records
+    if run is None:
+        run = records['run'].iloc[-1]
+    return records[records['run'] == run]
+
+def summarize(path, run = None, top = 10):
+    '''
+    where a run's time went: totals by stage and the tickers
+    that took longest, plus counts of status events
+    '''
+    records = read(path, run)
+    timed_records = records[records['stage'].notna()]
+    by_stage = timed_records.groupby('stage').agg(
+        seconds = ('seconds', 'sum'),
+        rows = ('rows', 'sum'),
+        tickers = ('ticker', 'nunique'),
+        peak_rss_mb = ('peak_rss_mb', 'max'),
+        )
+    by_stage = by_stage.reindex([s for s in stages if s in by_stage.index] + [s for s in by_stage.index if s not in stages])
+    by_stage['share'] = by_stage['seconds'] / by_stage['seconds'].sum()
+    by_stage['rows/s'] = by_stage['rows'] / by_stage['seconds']
+    by_ticker = timed_records.pivot_table(index = 'ticker', columns = 'stage', values = 'seconds', aggfunc = 'sum', fill_value = 0)
+    by_ticker['total'] = by_ticker.sum(axis = 1)
+    by_ticker = by_ticker.sort_values('total', ascending = False)[:top]
+    events = records[records['stage'].isna()].groupby('status').size()
+    return by_stage, by_ticker, events
+
+if __name__ == '__main__':
+
+    # python metrics.py /path/to/output/metrics.jsonl [run]
+    by_stage, by_ticker, events = summarize(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(by_stage.to_string(float_format = '{:.3f}'.format))
+    print()
+    print(by_ticker.to_string(float_format = '{:.3f}'.format))
+    if len(events):
+        print()
+        print(events.to_string())
@@ -0,0 +1,125 @@
+import os
+import pandas as pd
+
+# estimates that go into the panel, by method
+estimates = {
+    'gan_lk': 'pin_gan_lk_estimates.csv',
+    'gan_eho': 'pin_gan_eho_estimates.csv',
+    'ea_lk': 'pin_ea_lk_estimates.csv',
+    }
+
+# firm-level tables
+governance = 'stock_to_governance.csv'
+cnpj_to_b3 = 'cnpj_to_b3.csv'
+cnpj_to_cnae = 'cnpj_to_cnae.csv'
+
+# stocks w/o a governance listing are in the basic segment
+default_governance = 'Básico'
+
+def fix_quarters(quarters):
+    '''
+    _2019_4Q -> 2019Q4
+    '''
+    return quarters.str[1:5] + 'Q' + quarters.str[6]
+
+def fix_cnpjs(cnpjs):
+    '''
+    13.217.485/0001-11 -> 13217485000111
+    '''
+    return cnpjs.str.zfill(14).str.replace('[^0-9]', '', regex = True)
+
+def read_estimates(path, files = estimates):
+    '''
+    every method's estimates, stacked, w/ a method column
+    '''
+    dfs = []
+    for method, fname in files.items():
+        if not os.path.exists(path + fname):
+            continue
+        df = pd.read_csv(path + fname, dtype = {'ticker': str, 'quarter': str})
+        df.insert(0, 'method', method)
+        dfs.append(df)
+    return pd.concat(dfs, ignore_index = True)
+
+def build(path, tables_path = '', files = estimates):
+    '''
+    one (method, ticker, quarter) row per estimate, joined w/ the
+    governance level of the stock in that quarter, the firm's
+    CNPJ and its CNAE (3-digit group); tickers are matched on
+    their first four characters (the issuer), as are CNPJs when
+    an issuer has several
+    '''
+    df = read_estimates(path, files)
+    df['ticks'] = df['B_sum'] + df['S_sum']
+    df['subticker'] = df['ticker'].str[:4]
+
+    # governance levels
+    gov = pd.read_csv(tables_path + governance, dtype = str)
+    gov['quarter'] = fix_quarters(gov['quarter'])
+    df = df.merge(gov, how = 'left', on = ['subticker', 'quarter'])
+    df['governance'] = df['governance'].fillna(default_governance)
+    df['NM'] = df['governance'] == 'NM'
+
+    # CNPJs
+    cnpjs = pd.read_csv(tables_path + cnpj_to_b3, usecols = ['cnpj', 'codigo_B3'], dtype = str)
+    cnpjs['cnpj'] = fix_cnpjs(cnpjs['cnpj'])
+    cnpjs['subticker'] = cnpjs['codigo_B3'].str[:4]
+    cnpjs = cnpjs.drop_duplicates(subset = ['subticker'], keep = 'first')
+    df = df.merge(cnpjs[['subticker', 'cnpj']], how = 'left', on = 'subticker')
+
+    # CNAEs
+    cnae = pd.read_csv(tables_path + cnpj_to_cnae, usecols = ['cnpj', 'cnae'], dtype = str)
+    cnae['cnae'] = cnae['cnae'].str[:3]
+    cnae = cnae.drop_duplicates(subset = ['cnpj'], keep = 'first')
+    df = df.merge(cnae, how = 'left', on = 'cnpj')
+
+    # compact, typed columns
+    for column in ['method', 'ticker', 'quarter', 'subticker', 'governance', 'cnae']:
+        df[column] = df[column].astype('category')
+    df['cnpj'] = df['cnpj'].astype('string')
+    return df
+
+def inputs(path, tables_path = '', files = estimates):
+    fnames = [path + fname for fname in files.values()]
+    fnames += [tables_path + table for table in [governance, cnpj_to_b3, cnpj_to_cnae]]
+    return [fname for fname in fnames if os.path.exists(fname)]
+
+def load(path, tables_path = '', files = estimates, fname = 'panel.parquet'):
+    '''
+    the panel, from path/panel.parquet if it's newer than all of
+    its inputs, else built (and saved there)
+    '''
+    panel_path = path + fname
+    if os.path.exists(panel_path):
+        built = os.path.getmtime(panel_path)
+        if all(os.path.getmtime(e) <= built for e in inputs(path, tables_path, files)):
+            return pd.read_parquet(panel_path)
+    df = build(path, tables_path, files)
+    df.to_parquet(panel_path + '.tmp', index = False)
+    os.replace(panel_path + '.tmp', panel_path)
+    return df
+
+def summarize(df, by, column = 'PIN', method = 'gan_lk'):
+    '''
+    count, mean, std and quartiles of a column (of one method's
+    estimates) by quarter, governance, NM, cnae, ... (or a list
+    of them); a row for missing keys too (e.g., no CNAE)
+    '''
+    df = df[df['method'] == method]
+    return df.groupby(by, observed = True, dropna = False)[column].describe()
+
+def compare(df, a, b, column = 'PIN'):
+    '''
+    the stock-quarters estimated by both methods a and b,
+    side by side (column_a, column_b, plus ticks)
+    '''
+    wide = df[df['method'].isin([a, b])].pivot_table(
+        index = ['ticker', 'quarter'],
+        columns = 'method',
+        values = column,
+        observed = True
+        ).dropna()
+    wide = wide[[a, b]]
+    wide.columns = [column + '_' + a, column + '_' + b]
+    ticks = df[df['method'] == a].set_index(['ticker', 'quarter'])['ticks']
+    return wide.join(ticks, how = 'left')
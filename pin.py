@@ -1,137 +1,217 @@
-import sys
+import os
 import pyodbc
-import numpy as np
 import pandas as pd
-from rpy2 import robjects
-from random import randint
-from datetime import datetime
-
-# ID of process
-pid = str(randint(1, 100000))
+from db import get_tickers, table_sizes, ticks_query, read_daily_bars, read_rollup_bars
+from ticks import read_chunks, DailyBars
+import tickstore
+from estimators import estimate_batch, estimate_em, estimate_rolling, columns, version
+from scheduler import run
+from results import ResultStore, EstimateCache, fingerprint, series_key
+from trading_calendar import periods, is_session
+from metrics import Metrics
 
 # path to output data
 path = '/path/to/output/'
 
-# connect to database
-cnxn = pyodbc.connect(
-    driver = 'ODBC Driver 17 for SQL Server',
-    server = 'SqlServerName',
-    database = 'DbName',
-    uid = 'uid',
-    pwd = 'pwd',
-    chartset = 'UTF-8'
-)
-cursor = cnxn.cursor()
-
-# get all tickers
-tickers = []
-for row in cursor.tables():
-    table_name = row.table_name
-    if len(table_name) in (5, 6):
-        if table_name[:4].isalpha():
-            if table_name[:4].isupper():
-                if table_name[4:].isnumeric():
-                    tickers.append(table_name)
-tickers = sorted(tickers)
-
-# get batch of tickers to process
-batch = int(sys.argv[1])
-tickers = np.array_split(tickers, 6)[batch].tolist()
-
-# get start and end of each quarter
-quarters = [
-    ('2019Q4', 61, datetime(2019, 10, 1), datetime(2019, 12, 31)),
-    ('2020Q1', 62, datetime(2020, 1, 1), datetime(2020, 3, 31)),
-    ('2020Q2', 61, datetime(2020, 4, 1), datetime(2020, 6, 30)),
-    ('2020Q3', 65, datetime(2020, 7, 1), datetime(2020, 9, 30)),
-    ('2020Q4', 61, datetime(2020, 10, 1), datetime(2020, 12, 31)),
-    ('2021Q1', 60, datetime(2021, 1, 1), datetime(2021, 3, 31))
-]
-
-# list out holidays
-holidays = (
-    '2019-10-12',
-    '2019-11-02',
-    '2019-11-15',
-    '2019-12-24',
-    '2019-12-25',
-    '2019-12-31',
-    '2019-11-20',
-    '2020-01-01',
-    '2020-02-24',
-    '2020-02-25',
-    '2020-04-10',
-    '2020-04-21',
-    '2020-05-01',
-    '2020-06-11',
-    '2020-09-07',
-    '2020-10-12',
-    '2020-11-02',
-    '2020-12-24',
-    '2020-12-25',
-    '2020-12-31',
-    '2021-01-01',
-    '2021-01-25',
-    '2021-02-16'
-)
-
-# check if buy or sell transaction
-def buy_or_sell(flag):
-    '''
-    see https://www.mql5.com/en/forum/75268
-    for explanation on MetaTrader flags
-    '''
-    if (flag & 32) and (flag & 64):
-        return 'both'
-    elif flag & 32:
-        return 'buy'
-    elif flag & 64:
-        return 'sell'
-    else:
-        return 'neither' # shouldn't happen w/ trade ticks
+# how many tickers to process in parallel
+workers = os.cpu_count()
+
+# classify ticks and aggregate them into daily bars inside the
+# database (True) or here, holding chunksize ticks at a time (False)
+pushdown = True
+chunksize = 1000000
+
+# how to estimate the model:
+# initial values from 'GAN' or 'EA',
+# 'LK' or 'EHO' likelihood factorization
+method = 'GAN'
+likelihood = 'LK'
+
+# maximize the likelihood by expectation-maximization (from the
+# same initial values) instead of L-BFGS-B; quarters only, not
+# sliding windows; EM iterations and convergence of every
+# stock-quarter go to the metrics
+em = False
+
+# estimate on sliding windows of `window` trading days, moved
+# `step` days at a time, instead of on quarters (e.g. window = 60,
+# step = 1); each window's optimization starts from the last one's
+window = None
+step = 1
+
+# where ticks come from: 'db' (the database below), 'rollups'
+# (the daily totals the scraper keeps in the same database) or
+# 'store' (a local tick store at store_path, built w/ tickstore.convert)
+source = 'db'
+store_path = '/path/to/tickstore/'
+
+# cache estimates by their inputs (daily B and S, method and
+# likelihood), across methods and runs, in path/cache.db, keeping
+# at most cache_size of them (None = don't cache)
+cache_size = 1000000
+cache = None
+
+# per-stage wall time, rows and peak memory of every ticker, and
+# events like nodata, go to path/metrics.jsonl, one JSON record
+# per line (see where a run's time went w/ python metrics.py
+# path/metrics.jsonl)
+metrics = None
+
+# estimates are checkpointed, ticker by ticker, in path/results.db
+store = None
+
+# connect to database (once per process:
+# connections can't be shared between processes; only
+# workers, which do the estimating, open the cache)
+cnxn = None
+dialect = 'mssql'
+def connect(run_id = None, worker = True):
+    global cnxn, cache, metrics, store
+    metrics = Metrics(path + 'metrics.jsonl', run_id)
+    store = ResultStore(path + 'results.db')
+    if cache_size and worker:
+        cache = EstimateCache(path + 'cache.db', cache_size)
+    if source in ('db', 'rollups'):
+        cnxn = pyodbc.connect(
+            driver = 'ODBC Driver 17 for SQL Server',
+            server = 'SqlServerName',
+            database = 'DbName',
+            uid = 'uid',
+            pwd = 'pwd',
+            chartset = 'UTF-8'
+        )
+
+    # (or, to run against a local SQLite copy of the tick tables,
+    # cnxn = sqlite3.connect('ticks.db') here and dialect = 'sqlite')
+
+# estimation periods (label, trading sessions, first day, last day),
+# from the B3 calendar; or periods('M', ...) for months, or
+# [period(label, start, end), ...] for arbitrary ranges
+quarters = periods('Q', '2019-10-01', '2021-03-31')
 
-# loop through every quarter and ticker
-all_estimates = []
-for i, ticker in enumerate(tickers):
+# all quarters are read in a single scan per ticker
+first_day = min(tup[2] for tup in quarters).strftime('%Y-%m-%d')
+last_day = max(tup[3] for tup in quarters).strftime('%Y-%m-%d')
+span = '{}-{}'.format(quarters[0][0], quarters[-1][0])
+
+# what the estimates are stored under
+method_name = '{}-{}'.format(method, likelihood)
+if em:
+    method_name += '-EM'
+if window:
+    method_name += '-rolling-{}-{}'.format(window, step)
+
+# a ticker's daily bars, as fingerprint() parts
+def bar_rows(df):
+    return list(zip(df.index.strftime('%Y-%m-%d'), df['B'].tolist(), df['S'].tolist(), df['ticks'].tolist()))
+
+# load a ticker's daily bars and estimate every quarter; returns
+# the fingerprint of its data, the rows of estimates (None if
+# they're already stored w/ that fingerprint) and the lines to log
+def process_ticker(ticker):
+    rows = []
+    logs = []
+    timer = metrics.timer(ticker, span)
+
+    # load daily bars for all quarters, either aggregated inside
+    # the database or from ticks loaded chunk by chunk; either way,
+    # ticks are classified as buys or sells, dropping simultaneous
+    # transactions (buy AND sell) and non-transactions; the ticker
+    # is skipped if its estimates are stored w/ the same
+    # fingerprint, which changes if the database's daily bars
+    # (or, off the tick store, the rows and bytes of each day)
+    # from first_day to last_day change, or the estimators'
+    # version does
+    fp = None
+    try:
+        if source == 'store':
+            fp = fingerprint(first_day, last_day, version, *tickstore.window_totals(store_path, ticker, first_day, last_day))
+        else:
+            with timer('query'):
+                if source == 'rollups':
+                    all_days = read_rollup_bars(cnxn, ticker, first_day, last_day, dialect)
+                else:
+                    all_days = read_daily_bars(cnxn, ticker, first_day, last_day, dialect)
+            timer.add_rows('query', len(all_days))
+            fp = fingerprint(first_day, last_day, version, *bar_rows(all_days))
+        if store.done(ticker, method_name, fp):
+            timer.flush()
+            return fp, None, logs
+        if source == 'store':
+            daily = DailyBars()
+            for ticks in tickstore.read_chunks(store_path, ticker, first_day, last_day, timer = timer):
+                with timer('aggregate', len(ticks)):
+                    daily.add(ticks)
+            with timer('aggregate'):
+                all_days = daily.bars()
+            del daily
+        elif (source == 'db') and not pushdown:
+            query = ticks_query(ticker, first_day, last_day, dialect = dialect)
+            daily = DailyBars()
+            for ticks in read_chunks(cnxn, query, chunksize, timer = timer):
+                with timer('aggregate', len(ticks)):
+                    daily.add(ticks)
+            with timer('aggregate'):
+                all_days = daily.bars()
+            del daily
+    except MemoryError:
+        timer.flush()
+        metrics.event(ticker, span, 'MemoryError')
+        logs.append(','.join([
+            ticker, 
+            ' ', 
+            ' ', 
+            ' ',
+            ' ' ,
+            'MemoryError',
+            '\n'
+            ]))
+        return fp, rows, logs
+
+    if window:
+        # trading days w/ trades, over all quarters
+        df = all_days[is_session(all_days.index.values)]
+        df = df[(df['B'] > 0) | (df['S'] > 0)]
+        with timer('estimate', len(df)):
+            estimates = estimate_rolling(
+                df['B'].values,
+                df['S'].values,
+                window = window,
+                step = step,
+                method = method,
+                likelihood = likelihood
+                )
+        timer.flush()
+        for i, e, warm in estimates:
+            days = df.iloc[i + 1 - window:i + 1]
+            date = days.index[-1].strftime('%Y-%m-%d')
+            if e is None:
+                logs.append(','.join([
+                    ticker, 
+                    date, 
+                    str(days['B'].sum()),
+                    str(days['S'].sum()),
+                    'estimation_error',
+                    '\n'
+                    ]))
+                metrics.event(ticker, date, 'estimation_error')
+                continue
+            rows.append([ticker, date, days['B'].sum(), days['S'].sum(), window] + e)
+        return fp, rows, logs
+
+    bars = []
     for tup in quarters[::-1]: # get more recent quarters first
         quarter = tup[0]
-        trading_days = tup[1]
         date_start = tup[2].strftime('%Y-%m-%d')
         date_end = tup[3].strftime('%Y-%m-%d')
-        print(' ')
-        print(i, quarter, ticker)
-
-        # load tick data
-        query = '''
-        SET DATEFORMAT ymd;  
-
-        SELECT 
-            [ticktime], 
-            [flags]
-        FROM [db_stonks].[dbo].[{}]
-        WHERE [ticktime] >= CAST(N'{} 00:00:00' AS DateTime)
-        AND [ticktime] <= CAST(N'{} 23:59:59' AS DateTime)
-        '''.format(ticker, date_start, date_end)
-        try:
-            df = pd.read_sql(query, cnxn)
-        except MemoryError:
-            l = ','.join([
-                ticker, 
-                quarter, 
-                ' ', 
-                ' ',
-                ' ' ,
-                'MemoryError',
-                '\n'
-                ])
-            with open('log{}.txt'.format(pid), mode = 'a') as f:
-                f.write(l)
-            print('MemoryError')
-            continue
+
+        # this quarter's bars
+        with timer('aggregate'):
+            df = all_days[date_start:date_end]
 
         # drop if zero data
-        if df.shape[0] == 0:
-            l = ','.join([
+        if df['ticks'].sum() == 0:
+            logs.append(','.join([
                 ticker, 
                 quarter, 
                 ' ', 
@@ -139,108 +219,147 @@ for i, ticker in enumerate(tickers):
                 ' ',
                 'nodata',
                 '\n'
-                ])
-            with open('log{}.txt'.format(pid), mode = 'a') as f:
-                f.write(l)
-            print('nodata')
+                ]))
+            metrics.event(ticker, quarter, 'nodata')
             continue
 
-        # fix time column
-        df['ticktime'] = pd.to_datetime(df['ticktime'])
-        df = df.sort_values(by = 'ticktime')
-        df.set_index('ticktime', inplace = True)
-
-        # add column saying if buy or sell
-        df['trade'] = df['flags'].apply(buy_or_sell)
-        del df['flags']
-
-        # drop simultaneous transactions (buy AND sell)
-        df = df[df['trade'] != 'both']
+        with timer('aggregate'):
 
-        # drop non-transactions (shouldn't happen but who knows)
-        df = df[df['trade'] != 'neither']
+            # get sums
+            B_sum = df['B'].sum()
+            S_sum = df['S'].sum()
 
-        # recode buy/sell flags
-        df['B'] = df['trade'].map(lambda x: 1 if x == 'buy' else 0)
-        df['S'] = df['trade'].map(lambda x: 1 if x == 'sell' else 0)
-        del df['trade']
+            # drop holidays and weekends
+            df = df[is_session(df.index.values)]
 
-        # get sums
-        B_sum = df['B'].sum()
-        S_sum = df['S'].sum()
+            # drop days with zero trades
+            df = df[(df['B'] > 0) | (df['S'] > 0)]
 
-        # aggregate: ticks -> 1-day bars
-        df = df.resample('1d').sum()
-
-        # drop holidays
-        for date in holidays:
-            lb = date + ' 00:00:00'
-            ub = date + ' 23:59:59'
-            df = df[(df.index < lb) | (df.index > ub)]
+        # get how many days stock was traded
+        days_traded = df.shape[0]
 
-        # drop weekends
-        df = df[df.index.dayofweek < 5]
+        # drop if no trades on trading days (e.g., only ticks
+        # that are both or neither buys and sells, or only ticks
+        # on holidays, which the database's daily bars include)
+        if days_traded == 0:
+            logs.append(','.join([
+                ticker, 
+                quarter, 
+                ' ', 
+                ' ',
+                ' ',
+                'nodata',
+                '\n'
+                ]))
+            metrics.event(ticker, quarter, 'nodata')
+            continue
 
-        # drop days with zero trades
-        df = df[(df['B'] > 0) | (df['S'] > 0)]
+        # keep daily bars for batch estimation
+        bars.append((ticker, quarter, B_sum, S_sum, days_traded, df['B'].values, df['S'].values))
 
-        # get how many days stock was traded
-        days_traded = df.shape[0]
+    # reuse the estimates of stock-quarters whose inputs haven't changed
+    # (EM estimates are cached apart from L-BFGS-B ones)
+    parts = [method, likelihood, version] + (['EM'] if em else [])
+    keys = [series_key(B, S, *parts) for ticker, quarter, B_sum, S_sum, days_traded, B, S in bars]
+    cached = cache.get(keys) if cache else {}
+    todo = [i for i, key in enumerate(keys) if key not in cached]
 
-        # stringify buy bars
-        B = [str(e) for e in df['B'].values]
-        B = ', '.join(B)
-        B = 'c({})'.format(B)
-
-        # stringify sell bars
-        S = [str(e) for e in df['S'].values]
-        S = ', '.join(S)
-        S = 'c({})'.format(S)
-
-        # estimate model parameters!
-        rcode = '''
-        library("InfoTrad")
-        buy <- {}
-        sell <- {}
-        data <- as.data.frame(cbind(buy, sell))
-        GAN(data, likelihood="LK")
-        '''.format(B, S)
-        try:
-            estimates = robjects.r(rcode)
-        except Exception as e:
-            l = ','.join([
+    # estimate model parameters for all (other) quarters at once!
+    with timer('estimate', len(todo)):
+        if em:
+            fresh, iterations, converged = estimate_em(
+                [(bars[i][5], bars[i][6]) for i in todo],
+                method = method,
+                likelihood = likelihood
+                )
+        else:
+            fresh = estimate_batch(
+                [(bars[i][5], bars[i][6]) for i in todo],
+                method = method,
+                likelihood = likelihood
+                )
+    timer.flush()
+    if em:
+        for i, n, ok in zip(todo, iterations, converged):
+            metrics.event(ticker, bars[i][1], 'converged' if ok else 'not_converged', iterations = int(n))
+    estimates = [cached.get(key) for key in keys]
+    for i, e in zip(todo, fresh):
+        estimates[i] = e
+    if cache:
+        cache.put([(keys[i], e) for i, e in zip(todo, fresh) if e is not None])
+    for (ticker, quarter, B_sum, S_sum, days_traded, B, S), e in zip(bars, estimates):
+        if e is None:
+            logs.append(','.join([
                 ticker, 
                 quarter, 
                 str(B_sum),
                 str(S_sum),
-                'R_error',
+                'estimation_error',
                 '\n'
-                ])
-            with open('log{}.txt'.format(pid), mode = 'a') as f:
-                f.write(l)
-            unitroot = True
-            print(e)
+                ]))
+            metrics.event(ticker, quarter, 'estimation_error')
             continue
-
-        # append new row
         row = [ticker, quarter, B_sum, S_sum, days_traded]
-        row += [e[0] for e in estimates]
-        all_estimates.append(row)
-
-df = pd.DataFrame(all_estimates)
-df.columns = [
-    'ticker',
-    'quarter',
-    'B_sum',
-    'S_sum',
-    'days_traded',
-    'alpha',
-    'delta',
-    'mu',
-    'epsilon_b',
-    'epsilon_s',
-    'likelihood',
-    'PIN',
-    ]
-fname = 'pin_gan_lk_estimates_pid{}.csv'.format(pid)
-df.to_csv(path + fname, index = False)
+        row += e
+        rows.append(row)
+    return fp, rows, logs
+
+if __name__ == '__main__':
+
+    # get all tickers, w/ their sizes, so the biggest go first
+    if em and window:
+        raise ValueError('EM estimates quarters only')
+    connect(worker = False)
+    if source in ('db', 'rollups'):
+        tickers = get_tickers(cnxn, dialect)
+        sizes = table_sizes(cnxn, dialect)
+    else:
+        tickers = tickstore.get_tickers(store_path)
+        sizes = tickstore.sizes(store_path)
+
+    # process tickers in parallel, each worker w/ its own connection,
+    # committing each ticker's estimates as soon as they're ready
+    # (workers skip those already done)
+    fingerprints = {}
+    skipped = 0
+    tasks = run(process_ticker, tickers, sizes, workers = workers, initializer = connect, initargs = (metrics.run,))
+    for i, (ticker, (fp, rows, logs)) in enumerate(tasks):
+        fingerprints[ticker] = fp
+        if rows is None:
+            skipped += 1
+            continue
+        print(i, 'of', len(tickers), ticker)
+        if len(logs):
+            with open('log.txt', mode = 'a') as f:
+                f.write(''.join(logs))
+        if any('MemoryError' in l for l in logs):
+            continue # try again next time
+        records = [(row[1], row) for row in rows]
+        timer = metrics.timer(ticker, span)
+        with timer('write', len(records)):
+            store.commit(ticker, method_name, fingerprints[ticker], records)
+        timer.flush()
+    print(skipped, 'tickers already done')
+
+    # merge everything into one output file
+    timer = metrics.timer(None, span)
+    period = 'date' if window else 'quarter'
+    df = pd.DataFrame(store.rows(method_name, fingerprints), columns = [
+        'ticker',
+        period,
+        'B_sum',
+        'S_sum',
+        'days_traded',
+        ] + columns)
+    store.close()
+    df = df.sort_values(by = ['ticker', period], ascending = [True, False])
+    # (_native, so as not to overwrite the InfoTrad estimates
+    # that ship w/ the repo)
+    fname = 'pin_{}_{}_native_estimates.csv'.format(method.lower(), likelihood.lower())
+    if em:
+        fname = 'pin_{}_{}_native_em_estimates.csv'.format(method.lower(), likelihood.lower())
+    if window:
+        fname = 'pin_{}_{}_native_rolling{}_estimates.csv'.format(method.lower(), likelihood.lower(), window)
+    with timer('write', len(df)):
+        df.to_csv(path + fname, index = False)
+    timer.flush()
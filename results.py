@@ -0,0 +1,148 @@
+import json
+import time
+import sqlite3
+import hashlib
+import numpy as np
+
+def fingerprint(*parts):
+    '''
+    short hash of whatever identifies a task's inputs
+    '''
+    return hashlib.sha1('|'.join(str(e) for e in parts).encode()).hexdigest()[:16]
+
+def to_json(row):
+    return json.dumps([e.item() if hasattr(e, 'item') else e for e in row])
+
+class ResultStore:
+    '''
+    append-only, transactional store of results, keyed by
+    (ticker, period, method, fingerprint), in a SQLite file
+
+    each task commits all of its records in one transaction,
+    together w/ a marker record (period '*'); a task whose
+    marker is there is done and can be skipped on restart,
+    and one that crashed halfway left nothing behind
+    '''
+
+    def __init__(self, path):
+        self.cnxn = sqlite3.connect(path)
+        self.cnxn.execute('PRAGMA journal_mode = WAL')
+        self.cnxn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                ticker TEXT,
+                period TEXT,
+                method TEXT,
+                fingerprint TEXT,
+                payload TEXT,
+                created REAL,
+                PRIMARY KEY (ticker, period, method, fingerprint)
+            )
+            ''')
+        self.cnxn.commit()
+
+    def done(self, ticker, method, fingerprint):
+        query = '''
+            SELECT 1 FROM results
+            WHERE ticker = ? AND period = '*' AND method = ? AND fingerprint = ?
+            '''
+        return self.cnxn.execute(query, (ticker, method, fingerprint)).fetchone() is not None
+
+    def commit(self, ticker, method, fingerprint, records):
+        '''
+        store a finished task: records is a list of
+        (period, row) pairs, rows being JSON-able lists
+        '''
+        now = time.time()
+        values = [(ticker, period, method, fingerprint, to_json(row), now) for period, row in records]
+        values.append((ticker, '*', method, fingerprint, None, now))
+        with self.cnxn:
+            self.cnxn.executemany('INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?)', values)
+
+    def rows(self, method, fingerprints):
+        '''
+        stored rows of every ticker in fingerprints (a dict
+        ticker -> current fingerprint), in ticker/period order
+        '''
+        query = '''
+            SELECT ticker, period, fingerprint, payload FROM results
+            WHERE method = ? AND period <> '*'
+            ORDER BY ticker, period DESC
+            '''
+        rows = []
+        for ticker, period, fp, payload in self.cnxn.execute(query, (method,)):
+            if fingerprints.get(ticker) == fp:
+                rows.append(json.loads(payload))
+        return rows
+
+    def close(self):
+        self.cnxn.close()
+
+def series_key(B, S, *parts):
+    '''
+    content address of a daily (B, S) series and whatever else
+    determines its estimate (method, likelihood...)
+    '''
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(B, dtype = np.int64).tobytes())
+    h.update(b'|')
+    h.update(np.ascontiguousarray(S, dtype = np.int64).tobytes())
+    h.update('|'.join(str(e) for e in parts).encode())
+    return h.hexdigest()
+
+class EstimateCache:
+    '''
+    persistent cache of estimates keyed by series_key(), in a
+    SQLite file that can be shared by processes and by runs;
+    holds at most max_entries estimates, evicting the least
+    recently used ones
+    '''
+
+    def __init__(self, path, max_entries = 1000000):
+        self.max_entries = max_entries
+        self.cnxn = sqlite3.connect(path, timeout = 60)
+        self.cnxn.execute('PRAGMA journal_mode = WAL')
+        self.cnxn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                payload TEXT,
+                used REAL
+            )
+            ''')
+        self.cnxn.execute('CREATE INDEX IF NOT EXISTS cache_used ON cache (used)')
+        self.cnxn.commit()
+
+    def get(self, keys):
+        '''
+        cached estimates of keys, as a dict (misses left out)
+        '''
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = 'SELECT key, payload FROM cache WHERE key IN ({})'.format(', '.join('?' * len(chunk)))
+            for key, payload in self.cnxn.execute(query, chunk):
+                found[key] = json.loads(payload)
+        if found:
+            with self.cnxn:
+                self.cnxn.executemany('UPDATE cache SET used = ? WHERE key = ?', [(time.time(), key) for key in found])
+        return found
+
+    def put(self, items):
+        '''
+        cache (key, estimate) pairs, then evict down to max_entries
+        '''
+        now = time.time()
+        with self.cnxn:
+            self.cnxn.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                [(key, to_json(row), now) for key, row in items]
+                )
+            n = self.cnxn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if n > self.max_entries:
+                self.cnxn.execute('''
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM cache ORDER BY used LIMIT ?
+                    )
+                    ''', (n - self.max_entries,))
+
+    def close(self):
+        self.cnxn.close()
@@ -0,0 +1,24 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+def run(func, tasks, sizes = None, workers = None, initializer = None, initargs = ()):
+    '''
+    run func(task) for every task on a pool of worker processes
+    and yield (task, result) pairs as they complete
+
+    tasks are queued largest first (by sizes, e.g. estimated tick
+    counts) and every idle worker takes the next task off the
+    shared queue, so big tasks start early and no worker sits idle
+    while others still have a backlog; workers defaults to the
+    number of cores
+    '''
+    tasks = list(tasks)
+    if sizes is not None:
+        tasks = sorted(tasks, key = lambda task: -sizes.get(task, 0))
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers = workers, initializer = initializer, initargs = initargs) as pool:
+        futures = {}
+        for task in tasks:
+            futures[pool.submit(func, task)] = task
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -1,11 +1,10 @@
-import os
 import time
-import random
-import calendar
-import pandas as pd
-import MetaTrader5 as mt5
+import MetaTrader5 as mt5 # (or: import fake_mt5 as mt5, for a dry run)
 from sqlalchemy import create_engine, inspect
-from datetime import datetime, timedelta
+from datetime import date
+from ingest import ingest, to_frame, missing
+from db import BulkWriter, create_coverage, covered_dates, index_coverage, create_rollups, build_rollups
+from trading_calendar import sessions, is_session
 
 # connect to SQL Server
 engine = create_engine('mssql+pyodbc://SqlServerName/DbName?driver=SQL+Server')
@@ -51,118 +50,102 @@ tables = []
 for table_name in inspector.get_table_names():
     tables.append(table_name)
 
-# month-years to scrape
-months = {
-    2019: (10, 11, 12),
-    2020: range(1, 13),
-    2021: (1, 2, 3)
-}
+# first and last days to scrape; only the sessions in between
+# that aren't in the coverage table yet (or that were fetched
+# before they were over) are requested
+date_start = date(2019, 10, 1)
+date_end = date.today()
+dialect = 'mssql'
+
+# how to request ticks: up to `span` days per request (a request
+# that fails or returns max_ticks ticks or more is split in
+# halves), at most `rate` requests per second (w/ bursts of up
+# to `burst` requests), fetching at most queue_size days ahead
+# of what's been written
+span = 30
+max_ticks = 5000000
+rate = 1 / 3
+burst = 1
+queue_size = 64
+
+# prepare tables and find what's missing
+create_coverage(cnxn, dialect)
+create_rollups(cnxn, dialect)
+days = sessions(date_start, date_end).astype(object)
+tasks = []
+for ticker in tickers:
 
-# loop through tickers
-start = time.time()
-for i, ticker in enumerate(tickers):
-
-    # drop empty tables
-    if ticker in tables:
+    # create table for ticker
+    if ticker not in tables:
         query = '''
-        SELECT COUNT(*) FROM {}
+        CREATE TABLE {} (
+            ticktime datetime,
+            bid smallmoney,
+            ask smallmoney,
+            last smallmoney,
+            volume int,
+            time_msc bigint,
+            flags smallint,
+            volume_real int
+        );
         '''.format(ticker)
         cursor.execute(query)
-        count = cursor.fetchone()[0]
-        print('count:', ticker, count)
-        if count == 0:
-            query = '''
-            DROP TABLE {}
-            '''.format(ticker)
-            cursor.execute(query)
-            cnxn.commit()
-        else:
-            continue
-
-    # create table for ticker
-    query = '''
-    CREATE TABLE {} (
-        ticktime datetime,
-        bid smallmoney,
-        ask smallmoney,
-        last smallmoney,
-        volume int,
-        time_msc bigint,
-        flags smallint,
-        volume_real int
-    );
-    '''.format(ticker)
-    cursor.execute(query)
-    cnxn.commit()
-
-    # loop through month-years
-    for year in months.keys():
-        for month in months[year]:
-
-            # set date range
-            last_day = calendar.monthrange(year, month)[1]
-
-            # loop through days
-            for day in range(1, last_day + 1):
-                print(' ')
-                print(i, 'of', len(tickers), ticker, year, month, day)
-                t0 = datetime(year, month, day, 0, 0, 0)
-                t1 = datetime(year, month, day, 23, 59, 0)
-
-                # request tick data
-                ticks = mt5.copy_ticks_range(
-                    ticker, 
-                    t0, 
-                    t1, 
-                    mt5.COPY_TICKS_TRADE
-                    )
-                ticks = pd.DataFrame(ticks)
-
-                # log if results are empty
-                if ticks.shape[0] == 0:
-                    with open('log.txt', mode = 'a') as f:
-                        l = ticker + ',' + str(year) + ',' + str(month) + ',' + str(day) + '\n'
-                        f.write(l)
-                        print('empty DataFrame:', l)
-                        continue            # persist
-
-                print(ticks.shape[0])
-                ticks['time'] = pd.to_datetime(ticks['time'], unit = 's')
-                ticks.columns = [
-                    'ticktime',
-                    'bid',
-                    'ask',
-                    'last',
-                    'volume',
-                    'time_msc',
-                    'flags',
-                    'volume_real'
-                    ]
-                ticks.to_sql(
-                    ticker,
-                    con = engine,
-                    if_exists = 'append',
-                    index = False
-                    )
-
-                # commit changes
-                cnxn.commit()
-
-                # don't over-request
-                time.sleep(2.5 + random.random())
-
-    # delete tmp files
-    '''
-    for fname in os.listdir(path_to_tmp + ticker + '/'):
-        try:
-            os.remove(path_to_tmp + ticker + '/' + fname)
-        except:
-            pass
-    '''
-
-    # how long did it take?
-    elapsed = time.time() - start
-    print('it took', round(elapsed / 60), 'minutes')
+        cnxn.commit()
+
+    # what the table already has (tables from before the
+    # coverage table get indexed, and rolled up, once)
+    covered = covered_dates(cnxn, ticker, dialect)
+    if covered is None:
+        index_coverage(cnxn, ticker, dialect)
+        build_rollups(cnxn, ticker, dialect)
+        covered = covered_dates(cnxn, ticker, dialect) or set()
+    runs = missing(days, covered)
+    print(ticker, sum(day not in covered for day in days), 'sessions missing')
+    for first, last in runs:
+        tasks.append((ticker, first, last))
+
+# write each day's ticks as they arrive
+batch_rows = 1000000
+writer = BulkWriter(cnxn, dialect, batch_rows, track = True, rollup = True)
+def write(ticker, day, ticks):
+
+    # weekends and holidays in between missing sessions
+    if not is_session([day])[0]:
+        return
+
+    # log if results are empty (a failed request isn't recorded
+    # as covered, so it's tried again next time)
+    if (ticks is None) or (len(ticks) == 0):
+        with open('log.txt', mode = 'a') as f:
+            l = ticker + ',' + str(day.year) + ',' + str(day.month) + ',' + str(day.day) + '\n'
+            f.write(l)
+            print('empty DataFrame:', l)
+        if ticks is None:
+            return
+
+    # persist (in bulk, batch_rows ticks at a time; a day that's
+    # written again replaces the old one), along w/ the day's
+    # 1-minute bars and daily totals
+    print(ticker, day, len(ticks))
+    writer.add(ticker, day, to_frame(ticks))
+
+# fetch and write, concurrently
+start = time.time()
+ingest(
+    mt5,
+    tasks,
+    write,
+    span = span,
+    max_ticks = max_ticks,
+    rate = rate,
+    burst = burst,
+    queue_size = queue_size
+    )
+writer.flush()
+
+# how long did it take?
+elapsed = time.time() - start
+print('it took', round(elapsed / 60), 'minutes')
 
 # shut down connection to MetaTrader 5
 mt5.shutdown()
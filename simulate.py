@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from trading_calendar import sessions
+from ticks import TICK_FLAG_BUY, TICK_FLAG_SELL
+
+# other MetaTrader tick flags trade ticks carry
+TICK_FLAG_LAST = 8
+TICK_FLAG_VOLUME = 16
+
+class Simulation:
+    '''
+    synthetic trade ticks from the EKOP model w/ known parameters
+
+    each trading session has news w/ probability alpha, bad news
+    w/ probability delta; uninformed buys and sells arrive at
+    rates epsilon_b and epsilon_s and informed traders add mu
+    to the buys (good news) or the sells (bad news); days are
+    drawn up front (B, S, news: +1 good, -1 bad, 0 none), ticks
+    on demand, chunk by chunk, as raw MetaTrader-style rows
+    (ticktime, last, volume, flags), a share `ambiguous` of
+    which are flagged both buy and sell or neither
+    '''
+
+    def __init__(self, alpha, delta, mu, epsilon_b, epsilon_s, days = 240, start = '2019-10-01', seed = 0, ambiguous = 0.01):
+        self.params = np.array([alpha, delta, mu, epsilon_b, epsilon_s], dtype = float)
+        self.ambiguous = ambiguous
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        end = pd.Timestamp(start) + pd.Timedelta(days = 2 * days + 30)
+        self.dates = sessions(start, end)[:days]
+        news = rng.random(days) < alpha
+        bad = news & (rng.random(days) < delta)
+        good = news & ~bad
+        self.news = good.astype(np.int8) - bad.astype(np.int8)
+        self.B = rng.poisson(epsilon_b + mu * good)
+        self.S = rng.poisson(epsilon_s + mu * bad)
+
+    @classmethod
+    def of_size(cls, n_ticks, days = 240, alpha = 0.3, delta = 0.4, **kwargs):
+        '''
+        a simulation w/ about n_ticks ticks, informed and
+        uninformed arrival rates alike (mu = epsilon_b = epsilon_s)
+        '''
+        rate = n_ticks / days / (2 + alpha)
+        return cls(alpha, delta, rate, rate, rate, days = days, **kwargs)
+
+    @property
+    def n_ticks(self):
+        return int(self.B.sum() + self.S.sum())
+
+    def pin(self):
+        alpha, delta, mu, eb, es = self.params
+        return alpha * mu / (alpha * mu + eb + es)
+
+    def day_ticks(self, first, last, rng, price0 = 20.0):
+        '''
+        raw ticks of days first, ..., last - 1, in time order
+        '''
+        B, S = self.B[first:last], self.S[first:last]
+        n = B + S
+        N = int(n.sum())
+        day = np.repeat(np.arange(len(n)), n)
+        within = np.arange(N) - np.repeat(np.cumsum(n) - n, n)
+        buy = within < np.repeat(B, n)
+
+        # times: uniform over a 10:00-17:00 session
+        midnight = self.dates[first:last].astype('datetime64[ms]').view(np.int64)
+        t = midnight[day] + 10 * 3600 * 1000 + rng.integers(0, 7 * 3600 * 1000, N)
+        order = np.argsort(t, kind = 'stable')
+        t, buy = t[order], buy[order]
+
+        # flags, some ambiguous (both or neither)
+        flags = np.where(buy, TICK_FLAG_BUY, TICK_FLAG_SELL)
+        odd = rng.random(N) < self.ambiguous
+        flags[odd] = np.where(rng.random(odd.sum()) < 0.5, TICK_FLAG_BUY | TICK_FLAG_SELL, 0)
+        flags = (flags | TICK_FLAG_LAST | TICK_FLAG_VOLUME).astype(np.int16)
+
+        # prices: buys tick up, sells tick down, now and then
+        step = np.where(buy, 0.01, -0.01) * (rng.random(N) < 0.3)
+        price = np.maximum(price0 + np.cumsum(step), 0.01)
+
+        return pd.DataFrame({
+            'ticktime': t.astype('datetime64[ms]'),
+            'last': price,
+            'volume': (100 * rng.geometric(0.3, N)).astype(np.int32),
+            'flags': flags,
+            })
+
+    def chunks(self, chunk_ticks = 1000000):
+        '''
+        yield the ticks of whole days, about chunk_ticks at a time
+        '''
+        rng = np.random.default_rng(self.seed + 1)
+        n = self.B + self.S
+        first = 0
+        price = 20.0
+        while first < len(n):
+            total = np.cumsum(n[first:])
+            last = first + max(1, int(np.searchsorted(total, chunk_ticks, side = 'right')))
+            ticks = self.day_ticks(first, last, rng, price)
+            if len(ticks):
+                price = ticks['last'].values[-1]
+            yield ticks
+            first = last
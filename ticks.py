@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+from db import execute
+from metrics import timed
+
+# MetaTrader tick flags, see https://www.mql5.com/en/forum/75268
+TICK_FLAG_BUY = 32
+TICK_FLAG_SELL = 64
+
+# compact tick layout: epoch nanoseconds, +1 buy / -1 sell, volume
+# (and the trade price, if asked for)
+dtypes = {
+    'time': np.int64,
+    'side': np.int8,
+    'volume': np.int32,
+    'price': np.float64,
+    }
+
+def classify(flags):
+    '''
+    +1 for buys, -1 for sells, 0 for ticks that are
+    both (simultaneous) or neither (shouldn't happen
+    w/ trade ticks)
+    '''
+    flags = np.asarray(flags)
+    buy = (flags & TICK_FLAG_BUY) != 0
+    sell = (flags & TICK_FLAG_SELL) != 0
+    return buy.astype(np.int8) - sell.astype(np.int8)
+
+def compact(df, drop = True):
+    '''
+    raw ticks (ticktime, flags and, optionally, volume and last)
+    -> typed time/side/volume(/price) frame sorted by time (and,
+    if loaded, time_msc), w/o the ticks that are neither clearly
+    buys nor clearly sells (unless drop is False, in which case
+    they get side 0)
+    '''
+    ticktime = pd.to_datetime(df['ticktime'])
+    time = ticktime.values.astype('datetime64[ns]').view(np.int64)
+    side = classify(df['flags'].values)
+    if 'volume' in df.columns:
+        volume = df['volume'].values.astype(np.int32)
+    else:
+        volume = np.ones(len(time), dtype = np.int32)
+
+    # stable, so ticks that tie keep the order they came in (ties
+    # are common at ticktime's one-second resolution, and their
+    # order drives VPIN's buckets)
+    if 'time_msc' in df.columns:
+        order = np.lexsort((df['time_msc'].fillna(0).values.astype(np.int64), time))
+    else:
+        order = np.argsort(time, kind = 'stable')
+    if drop:
+        order = order[side[order] != 0]
+    out = pd.DataFrame({
+        'time': time[order],
+        'side': side[order],
+        'volume': volume[order],
+        })
+    if 'last' in df.columns:
+        out['price'] = df['last'].values.astype(np.float64)[order]
+    return out
+
+def daily_bars(ticks):
+    '''
+    compact ticks -> daily buy (B), sell (S) and total
+    (ticks) counts, one row per calendar day from the first
+    to the last tick, like resample('1d').sum()
+    '''
+    day = ticks['time'].values // (86400 * 10**9)
+    first = day.min() if len(day) else 0
+    offset = day - first
+    n = offset.max() + 1 if len(day) else 0
+    side = ticks['side'].values
+    B = np.bincount(offset, weights = side == 1, minlength = n).astype(np.int64)
+    S = np.bincount(offset, weights = side == -1, minlength = n).astype(np.int64)
+    total = np.bincount(offset, minlength = n).astype(np.int64)
+    index = pd.DatetimeIndex((first + np.arange(n)).astype('datetime64[D]'))
+    return pd.DataFrame({'B': B, 'S': S, 'ticks': total}, index = index)
+
+def daily_volume(ticks):
+    '''
+    total volume of each day w/ ticks
+    '''
+    day = ticks['time'].values // (86400 * 10**9)
+    days, offset = np.unique(day, return_inverse = True)
+    return np.bincount(offset, weights = ticks['volume'].values, minlength = len(days)).astype(np.int64)
+
+def read_chunks(cnxn, query, chunksize = 1000000, drop = True, timer = None):
+    '''
+    run query and yield its ticks as compact frames of at
+    most chunksize rows each; rows come off the cursor in
+    chunks, so memory is bounded by chunksize rather than
+    by the size of the result (query must ORDER BY ticktime,
+    time_msc);
+    w/ a metrics timer, time spent fetching goes to 'query'
+    and time spent compacting to 'classify'
+    '''
+    with timed(timer, 'query'):
+        cursor = execute(cnxn, query)
+    if cursor is None:
+        return
+    columns = [e[0] for e in cursor.description]
+    while True:
+        with timed(timer, 'query'):
+            rows = cursor.fetchmany(chunksize)
+        if not rows:
+            break
+        if timer is not None:
+            timer.add_rows('query', len(rows))
+        with timed(timer, 'classify', len(rows)):
+            df = pd.DataFrame.from_records([tuple(row) for row in rows], columns = columns)
+            del rows
+            df = compact(df, drop)
+        yield df
+    cursor.close()
+
+class DailyBars:
+    '''
+    incremental daily_bars(): add compact ticks chunk by
+    chunk, get the daily buy/sell counts at the end
+    '''
+
+    def __init__(self):
+        self.chunks = []
+
+    def add(self, ticks):
+        if len(ticks):
+            self.chunks.append(daily_bars(ticks))
+
+    def bars(self):
+        if len(self.chunks) == 0:
+            return pd.DataFrame({'B': [], 'S': [], 'ticks': []}, index = pd.DatetimeIndex([]), dtype = np.int64)
+        df = pd.concat(self.chunks).groupby(level = 0).sum()
+        return df.asfreq('D', fill_value = 0)
+
+def rollups(ticktime, price, volume, flags):
+    '''
+    raw tick columns -> 1-minute bars (open, high, low, close,
+    volume, ticks, buys, sells, buy_volume, sell_volume), one row
+    per minute w/ ticks, and the same totals by trade date; ticks
+    are classified as in classify(), so ticks that are both or
+    neither count towards volume and ticks but not buys or sells
+    '''
+    t = np.asarray(ticktime).astype('datetime64[s]').view(np.int64)
+    order = np.argsort(t, kind = 'stable')
+    t = t[order]
+    price = np.asarray(price, dtype = np.float64)[order]
+    volume = np.asarray(volume, dtype = np.int64)[order]
+    side = classify(np.asarray(flags)[order])
+    buy = side == 1
+    sell = side == -1
+    minute = t // 60
+    starts = np.flatnonzero(np.diff(minute, prepend = minute[:1] - 1)) if len(t) else np.zeros(0, dtype = np.int64)
+    ends = np.append(starts[1:], len(t))[:len(starts)] - 1
+    sums = lambda x: np.add.reduceat(x, starts) if len(starts) else np.zeros(0, dtype = np.int64)
+    minutes = pd.DataFrame({
+        'minute': (minute[starts] * 60).astype('datetime64[s]').astype('datetime64[ns]'),
+        'open': price[starts],
+        'high': np.maximum.reduceat(price, starts) if len(starts) else price[:0],
+        'low': np.minimum.reduceat(price, starts) if len(starts) else price[:0],
+        'close': price[ends],
+        'volume': sums(volume),
+        'ticks': ends - starts + 1,
+        'buys': sums(buy.astype(np.int64)),
+        'sells': sums(sell.astype(np.int64)),
+        'buy_volume': sums(np.where(buy, volume, 0)),
+        'sell_volume': sums(np.where(sell, volume, 0)),
+        })
+    totals = ['volume', 'ticks', 'buys', 'sells', 'buy_volume', 'sell_volume']
+    days = minutes[totals].groupby(minutes['minute'].values.astype('datetime64[D]')).sum()
+    days.index = pd.DatetimeIndex(days.index.values.astype('datetime64[ns]'), name = 'date')
+    return minutes, days.reset_index()
@@ -0,0 +1,179 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.fs
+import pyarrow.dataset as ds
+from db import execute, ticks_query, schema
+from ticks import compact
+from metrics import timed
+
+# on-disk layout: <root>/ticker=PETR4/date=2020-01-02/part-0.arrow;
+# uncompressed Arrow IPC files, so memory-mapped reads are zero-copy
+arrow_schema = pa.schema([
+    ('ticktime', pa.timestamp('ms')),
+    ('bid', pa.float64()),
+    ('ask', pa.float64()),
+    ('last', pa.float64()),
+    ('volume', pa.int32()),
+    ('time_msc', pa.int64()),
+    ('flags', pa.int16()),
+    ('volume_real', pa.int32()),
+    ])
+partitioning = ds.partitioning(pa.schema([('date', pa.string())]), flavor = 'hive')
+filesystem = pa.fs.LocalFileSystem(use_mmap = True)
+
+def ticker_path(root, ticker):
+    return os.path.join(root, 'ticker={}'.format(ticker))
+
+def get_tickers(root):
+    '''
+    tickers in the store
+    '''
+    tickers = []
+    for fname in os.listdir(root):
+        if fname.startswith('ticker='):
+            tickers.append(fname.replace('ticker=', ''))
+    return sorted(tickers)
+
+def sizes(root):
+    '''
+    bytes on disk for each ticker in the store
+    '''
+    sizes = {}
+    for ticker in get_tickers(root):
+        total = 0
+        for dirpath, dirnames, fnames in os.walk(ticker_path(root, ticker)):
+            total += sum(os.path.getsize(os.path.join(dirpath, fname)) for fname in fnames)
+        sizes[ticker] = total
+    return sizes
+
+def window_totals(root, ticker, date_start, date_end):
+    '''
+    [(date, rows, bytes), ...] of every trade date from
+    date_start to date_end in the store, off the files'
+    metadata (i.e., w/o reading ticks)
+    '''
+    if not os.path.isdir(ticker_path(root, ticker)):
+        return []
+    where = (ds.field('date') >= date_start) & (ds.field('date') <= date_end)
+    totals = {}
+    for fragment in dataset(root, ticker).get_fragments(filter = where):
+        date = str(ds.get_partition_keys(fragment.partition_expression)['date'])
+        rows, size = totals.get(date, (0, 0))
+        totals[date] = (rows + fragment.count_rows(), size + os.path.getsize(fragment.path))
+    return [(date,) + totals[date] for date in sorted(totals)]
+
+def to_table(df):
+    '''
+    raw tick rows -> Arrow table w/ the store's schema
+    '''
+    df = df.copy()
+    df['ticktime'] = pd.to_datetime(df['ticktime']).values.astype('datetime64[ms]')
+    for col in ('bid', 'ask', 'last'):
+        df[col] = df[col].astype(float)
+    table = pa.Table.from_pandas(df[arrow_schema.names], schema = arrow_schema, preserve_index = False)
+    date = pa.array(df['ticktime'].dt.strftime('%Y-%m-%d'), pa.string())
+    return table.append_column('date', date)
+
+def write(root, ticker, df, part = 0):
+    '''
+    add raw tick rows to the store, one file per date
+    '''
+    ds.write_dataset(
+        to_table(df),
+        ticker_path(root, ticker),
+        format = 'ipc',
+        partitioning = partitioning,
+        basename_template = 'part-{}-{{i}}.arrow'.format(part),
+        existing_data_behavior = 'overwrite_or_ignore'
+        )
+
+def convert(cnxn, root, ticker, date_start = '1900-01-01', date_end = '2100-12-31', dialect = 'mssql', chunksize = 1000000):
+    '''
+    copy a ticker's table from the database into the store
+    (replacing whatever the store had for that ticker)
+    '''
+    shutil.rmtree(ticker_path(root, ticker), ignore_errors = True)
+    columns = [name for name, kind in schema]
+    query = ticks_query(ticker, date_start, date_end, columns = columns, dialect = dialect)
+    cursor = execute(cnxn, query)
+    if cursor is None:
+        return 0
+    n = 0
+    part = 0
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        if not rows:
+            break
+        df = pd.DataFrame.from_records([tuple(row) for row in rows], columns = columns)
+        write(root, ticker, df, part)
+        n += len(df)
+        part += 1
+    cursor.close()
+    return n
+
+def dataset(root, ticker):
+    return ds.dataset(
+        ticker_path(root, ticker),
+        format = 'ipc',
+        partitioning = partitioning,
+        filesystem = filesystem
+        )
+
+def read(root, ticker, date_start, date_end, columns = ('ticktime', 'flags')):
+    '''
+    a ticker's ticks between two dates (inclusive), as an Arrow
+    table; the date filter prunes whole partitions and the
+    columns are memory-mapped, not copied
+    '''
+    if not os.path.isdir(ticker_path(root, ticker)):
+        return arrow_schema.empty_table().select(list(columns))
+    where = (ds.field('date') >= date_start) & (ds.field('date') <= date_end)
+    return dataset(root, ticker).to_table(columns = list(columns), filter = where)
+
+def part_number(fragment):
+    '''
+    part-3-0.arrow -> (3, 0), so a date's files are read in
+    the order they were written
+    '''
+    return tuple(int(e) for e in os.path.basename(fragment.path)[5:-6].split('-'))
+
+def read_chunks(root, ticker, date_start, date_end, columns = ('ticktime', 'flags'), drop = True, timer = None):
+    '''
+    like ticks.read_chunks, but off the store, one trade
+    date per chunk, in time order
+    '''
+    if not os.path.isdir(ticker_path(root, ticker)):
+        return
+    where = (ds.field('date') >= date_start) & (ds.field('date') <= date_end)
+    fragments = dataset(root, ticker).get_fragments(filter = where)
+    by_date = {}
+    for fragment in fragments:
+        date = ds.get_partition_keys(fragment.partition_expression)['date']
+        by_date.setdefault(date, []).append(fragment)
+    for date in sorted(by_date):
+        with timed(timer, 'query'):
+            parts = sorted(by_date[date], key = part_number)
+            tables = [fragment.to_table(columns = list(columns)) for fragment in parts]
+            df = pa.concat_tables(tables).to_pandas()
+        if timer is not None:
+            timer.add_rows('query', len(df))
+        with timed(timer, 'classify', len(df)):
+            df = compact(df, drop)
+        yield df
+
+def read_daily_volume(root, ticker, date_start, date_end):
+    '''
+    total volume of each trade date from date_start to
+    date_end in the store
+    '''
+    if not os.path.isdir(ticker_path(root, ticker)):
+        return np.zeros(0, dtype = np.int64)
+    where = (ds.field('date') >= date_start) & (ds.field('date') <= date_end)
+    table = dataset(root, ticker).to_table(columns = ['date', 'volume'], filter = where)
+    if table.num_rows == 0:
+        return np.zeros(0, dtype = np.int64)
+    sums = table.group_by('date').aggregate([('volume', 'sum')]).sort_by('date')
+    return sums.column('volume_sum').to_numpy().astype(np.int64)
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+# B3 closes on these national holidays (month, day)...
+fixed = [
+    (1, 1),
+    (4, 21),
+    (5, 1),
+    (9, 7),
+    (10, 12),
+    (11, 2),
+    (11, 15),
+    (12, 24),
+    (12, 25),
+    (12, 31),
+    ]
+
+# ...and, until 2021, on São Paulo's municipal and state holidays
+sao_paulo = [
+    (1, 25),
+    (7, 9),
+    (11, 20),
+    ]
+
+# year-specific exceptions: in 2020 São Paulo moved these holidays
+# to May (because of COVID) and B3 traded on the original dates
+exceptions = {
+    2020: [(7, 9), (11, 20)],
+    }
+
+def easter(year):
+    '''
+    Gregorian Easter Sunday (anonymous algorithm)
+    '''
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def holidays(first_year, last_year):
+    '''
+    B3 holidays (incl. those that fall on weekends)
+    as a sorted datetime64[D] array
+    '''
+    days = []
+    for year in range(first_year, last_year + 1):
+        md = list(fixed)
+        if year <= 2021:
+            md += sao_paulo
+        elif year >= 2024:
+            md.append((11, 20)) # national holiday since 2024
+        md = [e for e in md if e not in exceptions.get(year, [])]
+        days += [date(year, month, day) for month, day in md]
+        e = np.datetime64(easter(year))
+        days += [e - 48, e - 47, e - 2, e + 60] # carnival, Good Friday, Corpus Christi
+    return np.unique(np.array(days, dtype = 'datetime64[D]'))
+
+def to_day(d):
+    return np.datetime64(pd.Timestamp(d).date(), 'D')
+
+def sessions(start, end):
+    '''
+    B3 trading sessions between start and end (inclusive),
+    as a datetime64[D] array
+    '''
+    start, end = to_day(start), to_day(end)
+    days = np.arange(start, end + 1, dtype = 'datetime64[D]')
+    return days[is_session(days)]
+
+def is_session(days):
+    '''
+    vectorized: is each day (anything convertible to
+    datetime64) a B3 trading session?
+    '''
+    days = np.asarray(days).astype('datetime64[D]')
+    if len(days) == 0:
+        return np.zeros(0, dtype = bool)
+    years = days.astype('datetime64[Y]').astype(int) + 1970
+    return np.is_busday(days, holidays = holidays(years.min(), years.max()))
+
+def periods(freq, start, end):
+    '''
+    estimation periods between start and end, as (label,
+    trading sessions, first day, last day) tuples; freq is
+    'Q' (e.g. 2020Q1), 'M' (e.g. 2020-01) or 'Y' (e.g. 2020)
+    '''
+    labels = {
+        'Q': lambda p: '{}Q{}'.format(p.year, p.quarter),
+        'M': lambda p: '{}-{:02d}'.format(p.year, p.month),
+        'Y': lambda p: str(p.year),
+        }
+    out = []
+    for p in pd.period_range(start, end, freq = freq):
+        first = max(p.start_time.normalize(), pd.Timestamp(start))
+        last = min(p.end_time.normalize(), pd.Timestamp(end))
+        n = len(sessions(first, last))
+        out.append((labels[freq](p), n, first.to_pydatetime(), last.to_pydatetime()))
+    return out
+
+def period(label, start, end):
+    '''
+    an arbitrary estimation period, in the same format
+    '''
+    n = len(sessions(start, end))
+    return (label, n, pd.Timestamp(start).to_pydatetime(), pd.Timestamp(end).to_pydatetime())
@@ -0,0 +1,36 @@
+import sys
+import numpy as np
+import pandas as pd
+from scipy.stats import pearsonr
+
+# compare estimates from estimators.py (as written by pin.py)
+# against the InfoTrad ones that ship with the repo, e.g.:
+# python validate_estimates.py /path/to/output/pin_gan_lk_native_estimates.csv pin_gan_lk_estimates.csv
+new = pd.read_csv(sys.argv[1])
+old = pd.read_csv(sys.argv[2])
+df = pd.merge(
+    new,
+    old,
+    how = 'inner',
+    on = ['ticker', 'quarter'],
+    suffixes = ['_new', '_old']
+    )
+print('stock-quarters in both files:', df.shape[0])
+
+# same input data?
+same_input = (df['B_sum_new'] == df['B_sum_old']) & (df['S_sum_new'] == df['S_sum_old'])
+print('with same B_sum and S_sum:', same_input.sum())
+df = df[same_input]
+
+# same estimates?
+for col in ['alpha', 'delta', 'mu', 'epsilon_b', 'epsilon_s', 'PIN']:
+    diff = (df[col + '_new'] - df[col + '_old']).abs()
+    print(col, 'max abs diff:', diff.max(), 'median abs diff:', diff.median())
+print(pearsonr(df['PIN_new'], df['PIN_old']))
+
+# higher likelihood = better optimum (inf means EHO overflowed)
+finite = np.isfinite(df['likelihood_new']) & np.isfinite(df['likelihood_old'])
+diff = df[finite]['likelihood_new'] - df[finite]['likelihood_old']
+print('likelihood new > old:', (diff > 1e-6).sum())
+print('likelihood new < old:', (diff < -1e-6).sum())
+print('likelihood new = old:', (diff.abs() <= 1e-6).sum())
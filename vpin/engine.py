@@ -0,0 +1,365 @@
+import numpy as np
+from scipy.stats import norm
+
+class VPIN:
+    '''
+    streaming VPIN: fills volume buckets of size V tick by tick
+    and, once n buckets are complete, emits VPIN = sum of the last
+    n bucket imbalances / (n * V)
+
+    bucket imbalances live in a fixed-size ring buffer with a
+    running sum, so each tick costs O(1); the bucketing rules are
+    the ones vpin.py always used: a tick that crosses the bucket
+    boundary closes the bucket and carries its excess volume into
+    the next one, and while the carried volume alone fills a
+    bucket, each incoming tick closes one more bucket in the
+    carry's direction (and that tick's own volume is discarded)
+    '''
+
+    def __init__(self, V, n = 250):
+        if V <= 0:
+            raise ValueError('V must be positive')
+        self.V = V
+        self.n = n
+        self.ring = [0] * n # bucket imbalances
+        self.head = 0 # position of the oldest bucket
+        self.count = 0 # buckets in the ring
+        self.imbalance = 0 # running sum of the ring
+        self.total_volume = 0
+        self.buy_volume = 0
+        self.sell_volume = 0
+        self.buy = None # direction of the last tick
+
+    def close_bucket(self, imbalance):
+        self.ring[(self.head + self.count) % self.n] = imbalance
+        self.imbalance += imbalance
+        self.count += 1
+
+    def update(self, volume, buy):
+        '''
+        feed one tick; returns the VPIN emitted at this
+        tick (before its volume is bucketed) or None
+        '''
+        V = self.V
+        vpin = None
+
+        # calculate VPIN, then discard first bucket
+        if self.count == self.n:
+            vpin = self.imbalance / (self.n * V)
+            self.imbalance -= self.ring[self.head]
+            self.head = (self.head + 1) % self.n
+            self.count -= 1
+
+        # excess volume from before triggers V?
+        if self.total_volume >= V:
+            self.close_bucket(V)
+            excess = self.total_volume - V
+            self.total_volume = excess
+            if self.buy:
+                self.buy_volume, self.sell_volume = excess, 0
+            else:
+                self.buy_volume, self.sell_volume = 0, excess
+            return vpin
+
+        volume = int(volume)
+        self.buy = buy
+
+        # triggers V?
+        if self.total_volume + volume >= V:
+            excess = (self.total_volume + volume) - V
+            if buy:
+                self.close_bucket(abs(V - 2 * self.sell_volume))
+                self.buy_volume, self.sell_volume = excess, 0
+            else:
+                self.close_bucket(abs(V - 2 * self.buy_volume))
+                self.buy_volume, self.sell_volume = 0, excess
+            self.total_volume = excess
+            return vpin
+
+        # add new volume to current bucket
+        self.total_volume += volume
+        if buy:
+            self.buy_volume += volume
+        else:
+            self.sell_volume += volume
+        return vpin
+
+    def update_many(self, times, volumes, buys):
+        '''
+        feed an array of ticks; returns the times and
+        values of the VPINs emitted along the way
+        '''
+        out_times = []
+        out_vpins = []
+        update = self.update
+        for t, volume, buy in zip(times, volumes.tolist(), buys.tolist()):
+            vpin = update(volume, buy)
+            if vpin is not None:
+                out_times.append(t)
+                out_vpins.append(vpin)
+        return np.array(out_times, dtype = np.asarray(times).dtype), np.array(out_vpins, dtype = float)
+
+def get_V(daily_volumes, buckets_per_day = 50):
+    '''
+    bucket size: 1/50th of average daily volume
+    (0 if there are no days)
+    '''
+    daily_volumes = np.asarray(daily_volumes, dtype = np.int64)
+    if len(daily_volumes) == 0:
+        return 0
+    avg_daily_vol = daily_volumes.sum() / len(daily_volumes)
+    return int(avg_daily_vol / buckets_per_day)
+
+def buckets(volumes, buys, V):
+    '''
+    vectorized version of the VPIN class's bucketing, for whole
+    series at once; returns, for every bucket, the index of the
+    tick that closed it and its imbalance
+    '''
+    closed_at, imbalances, state = buckets_from(volumes, buys, V)
+    return closed_at, imbalances
+
+def buckets_from(volumes, buys, V, state = (0, 0, 0, 0)):
+    '''
+    buckets(), for one chunk of a series: state is what the
+    previous chunk left over (pure buckets still to be closed
+    by the next ticks, then the volume, buy volume and sell
+    volume carried into the current bucket); returns the
+    chunk's buckets and the state it leaves
+
+    cumulative volume tells where bucket boundaries fall, as long
+    as no single tick leaves a carry of V or more; when one does,
+    the ticks it swallows are closed as pure buckets and the scan
+    restarts after them with the leftover carry
+    '''
+    v = np.asarray(volumes, dtype = np.int64)
+    b = np.asarray(buys, dtype = bool)
+    N = len(v)
+    G = np.concatenate([[0], np.cumsum(v)])
+    GB = np.concatenate([[0], np.cumsum(np.where(b, v, 0))])
+    GS = np.concatenate([[0], np.cumsum(np.where(b, 0, v))])
+    pending, t0, bv0, sv0 = state # carry into the chunk
+
+    # the previous chunk's carry swallows the first ticks
+    s = min(pending, N) # first tick of the segment
+    closed_at = [np.arange(s)]
+    imbalances = [np.full(s, V, dtype = np.int64)]
+    pending -= s
+    while s < N:
+
+        # buckets closed since the segment began, looking ahead
+        # in growing windows for a tick that leaves a carry >= V
+        offset = t0 - G[s]
+        w = 4096
+        while True:
+            e = min(s + w, N)
+            m = (G[s + 1:e + 1] + offset) // V
+            jumps = np.diff(m, prepend = 0)
+            hit = np.flatnonzero(jumps >= 2)
+            if len(hit) or (e == N):
+                break
+            w *= 2
+        end = s + hit[0] if len(hit) else e - 1
+
+        # ticks that cross a bucket boundary
+        closes = np.flatnonzero(jumps[:end - s + 1] >= 1) + s
+        if len(closes):
+            prev = closes[:-1]
+            carry = G[prev + 1] + offset - np.arange(1, len(closes)) * V
+            ref = np.concatenate([[s], prev + 1])
+            carry_b = np.concatenate([[bv0], np.where(b[prev], carry, 0)])
+            carry_s = np.concatenate([[sv0], np.where(b[prev], 0, carry)])
+            buy_before = carry_b + GB[closes] - GB[ref]
+            sell_before = carry_s + GS[closes] - GS[ref]
+            closed_at.append(closes)
+            imbalances.append(np.where(
+                b[closes],
+                np.abs(V - 2 * sell_before),
+                np.abs(V - 2 * buy_before)
+                ))
+        if not len(hit):
+
+            # what's in the open bucket at the end of the chunk
+            if len(closes):
+                c = closes[-1]
+                carry = G[c + 1] + offset - len(closes) * V
+                bv0 = (carry if b[c] else 0) + GB[N] - GB[c + 1]
+                sv0 = (0 if b[c] else carry) + GS[N] - GS[c + 1]
+            else:
+                bv0 = bv0 + GB[N] - GB[s]
+                sv0 = sv0 + GS[N] - GS[s]
+            t0 = G[N] + offset - len(closes) * V
+            break
+
+        # the carry swallows the next ticks, one pure bucket each
+        # (some of them maybe in the next chunk)
+        carry = G[end + 1] + offset - len(closes) * V
+        r = carry // V
+        skipped = np.arange(end + 1, min(end + 1 + r, N))
+        closed_at.append(skipped)
+        imbalances.append(np.full(len(skipped), V, dtype = np.int64))
+        pending = end + 1 + r - min(end + 1 + r, N)
+        t0 = carry - r * V
+        bv0, sv0 = (t0, 0) if b[end] else (0, t0)
+        s = end + 1 + r
+
+    state = (int(pending), int(t0), int(bv0), int(sv0))
+    return np.concatenate(closed_at).astype(np.int64), np.concatenate(imbalances).astype(np.int64), state
+
+class ChunkedVPIN:
+    '''
+    vectorized VPIN, chunk by chunk: same output as feeding the
+    chunks to VPIN(V, n).update_many, at vpin_batch's speed,
+    keeping only the bucketing state and the last n buckets
+    between chunks (so memory is bounded by the chunk size)
+    '''
+
+    def __init__(self, V, n = 250):
+        if V <= 0:
+            raise ValueError('V must be positive')
+        self.V = V
+        self.n = n
+        self.state = (0, 0, 0, 0)
+        self.closed_at = np.zeros(0, dtype = np.int64) # relative to the next chunk
+        self.imbalances = np.zeros(0, dtype = np.int64)
+
+    def update_many(self, times, volumes, buys):
+        '''
+        feed an array of ticks; returns the times and
+        values of the VPINs emitted along the way
+        '''
+        times = np.asarray(times)
+        N = len(times)
+        closed_at, imbalances, self.state = buckets_from(volumes, buys, self.V, self.state)
+        closed_at = np.concatenate([self.closed_at, closed_at])
+        imbalances = np.concatenate([self.imbalances, imbalances])
+
+        # rolling sum of the last n imbalances, emitted at the tick
+        # after the one that closed the bucket (which, for a bucket
+        # closed by the last tick of the previous chunk, is this
+        # chunk's first; buckets emitted before are skipped)
+        n, V = self.n, self.V
+        total = np.concatenate([[0], np.cumsum(imbalances)])
+        c = np.arange(n - 1, len(imbalances))
+        emit = closed_at[c] + 1
+        keep = (emit >= 0) & (emit < N)
+        vpins = (total[c + 1] - total[c + 1 - n]) / (n * V)
+
+        # keep the last n buckets for the next chunk
+        self.closed_at = closed_at[-n:] - N
+        self.imbalances = imbalances[-n:]
+        return times[emit[keep]], vpins[keep]
+
+def vpin_batch(times, volumes, buys, V, n = 250):
+    '''
+    VPIN for a whole series at once; same output as feeding
+    the series to VPIN(V, n).update_many
+    '''
+    if V <= 0:
+        raise ValueError('V must be positive')
+    times = np.asarray(times)
+    closed_at, imbalances = buckets(volumes, buys, V)
+
+    # rolling sum of the last n imbalances, emitted at
+    # the tick after the one that closed the bucket
+    total = np.concatenate([[0], np.cumsum(imbalances)])
+    c = np.arange(n - 1, len(imbalances))
+    emit = closed_at[c] + 1
+    keep = emit < len(times)
+    vpins = (total[c + 1] - total[c + 1 - n]) / (n * V)
+    return times[emit[keep]], vpins[keep]
+
+def time_bars(times, prices, volumes, seconds = 60):
+    '''
+    ticks -> time bars of `seconds` seconds (only bars w/ ticks);
+    returns each bar's last tick time, close price and volume
+    '''
+    times = np.asarray(times)
+    t = times.astype('datetime64[ns]').view(np.int64)
+    bar = t // (seconds * 10**9)
+    starts = np.flatnonzero(np.diff(bar, prepend = bar[:1] - 1)) if len(bar) else np.zeros(0, dtype = np.int64)
+    ends = np.append(starts[1:], len(bar))[:len(starts)] - 1
+    volume = np.add.reduceat(np.asarray(volumes, dtype = np.int64), starts) if len(starts) else np.zeros(0, dtype = np.int64)
+    return times[ends], np.asarray(prices, dtype = float)[ends], volume
+
+def bvc_batch(times, prices, volumes, V, n = 250, seconds = 60):
+    '''
+    VPIN w/ bulk volume classification (Easley, Lopez de Prado
+    & O'Hara 2012), from ticks aggregated into time bars of
+    `seconds` seconds; see bvc()
+    '''
+    bar_times, close, volume = time_bars(times, prices, volumes, seconds)
+    return bvc(bar_times, close, volume, V, n)
+
+def bvc(bar_times, close, volume, V, n = 250):
+    '''
+    VPIN w/ bulk volume classification, from time bars: the buy
+    share of each bar's volume is the normal CDF of the bar's
+    price change over the standard deviation of price changes, so
+    no tick needs a buy/sell flag; bars are spread over volume
+    buckets of size V pro rata (a bar may fill several buckets,
+    or part of one), and VPIN = sum of the last n buckets'
+    |buys - sells| / (n * V), emitted at the bar that closes
+    the latest bucket (once per bar)
+    '''
+    if V <= 0:
+        raise ValueError('V must be positive')
+    bar_times = np.asarray(bar_times)
+    close = np.asarray(close, dtype = float)
+    volume = np.asarray(volume, dtype = np.int64)
+    if len(volume) == 0:
+        return bar_times, np.zeros(0)
+
+    # buy share of each bar's volume
+    dp = np.diff(close, prepend = close[0])
+    sigma = dp[1:].std() if len(dp) > 1 else 0
+    if sigma > 0:
+        buy_share = norm.cdf(dp / sigma)
+    else:
+        buy_share = np.full(len(dp), 0.5)
+
+    # cumulative volume and buy volume at bar ends; buys are
+    # spread evenly over each bar's volume, so the buys in a
+    # bucket come from interpolating between bar ends
+    G = np.concatenate([[0], np.cumsum(volume)])
+    GB = np.concatenate([[0], np.cumsum(volume * buy_share)])
+    k = np.arange(1, G[-1] // V + 1)
+    buys = np.diff(np.interp(np.concatenate([[0], k * V]), G, GB))
+    imbalances = np.abs(2 * buys - V)
+
+    # rolling sum of the last n imbalances, at the bar
+    # where each bucket fills up (the last one per bar)
+    closed_at = np.searchsorted(G[1:], k * V, side = 'left')
+    total = np.concatenate([[0], np.cumsum(imbalances)])
+    c = np.arange(n - 1, len(imbalances))
+    if len(c) == 0:
+        return bar_times[:0], np.zeros(0)
+    vpins = (total[c + 1] - total[c + 1 - n]) / (n * V)
+    bars = closed_at[c]
+    last = np.append(bars[1:] != bars[:-1], True)
+    return bar_times[bars[last]], vpins[last]
+
+if __name__ == '__main__':
+
+    # check the vectorized engines against the tick-by-tick one
+    # on random series, some w/ ticks big enough to fill several
+    # buckets, fed to ChunkedVPIN in random chunks
+    rng = np.random.default_rng(0)
+    for trial in range(400):
+        N = int(rng.integers(1, 3000))
+        volumes = rng.geometric(0.3, N) * 100
+        if trial % 3 == 0:
+            big = rng.random(N) < 0.02
+            volumes[big] *= int(rng.integers(5, 60))
+        buys = rng.random(N) < 0.5
+        times = np.arange(N).astype('datetime64[s]')
+        V = int(rng.integers(100, 3000))
+        n = int(rng.integers(1, 30))
+        ref_times, ref_vpins = VPIN(V, n).update_many(times, volumes, buys)
+        cuts = np.sort(rng.choice(np.arange(1, N), size = min(N - 1, int(rng.integers(0, 20))), replace = False))
+        engine = ChunkedVPIN(V, n)
+        out = [engine.update_many(times[a:b], volumes[a:b], buys[a:b]) for a, b in zip(np.append(0, cuts), np.append(cuts, N))]
+        for t, v in [[np.concatenate(e) for e in zip(*out)], vpin_batch(times, volumes, buys, V, n)]:
+            assert np.array_equal(t, ref_times), 'trial {}: times differ'.format(trial)
+            assert np.allclose(v, ref_vpins), 'trial {}: VPINs differ'.format(trial)
+    print('ok')
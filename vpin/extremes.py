@@ -0,0 +1,217 @@
+import os
+import sys
+import heapq
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# shared modules live one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from scheduler import run
+
+# how many of the highest and of the lowest VPINs to keep, per
+# ticker and per quarter (and over the ticker's whole series)
+k = 100
+
+# how many VPINs to read at a time
+chunksize = 1000000
+
+def quarters(times):
+    '''
+    epoch nanoseconds -> quarters since 1970
+    '''
+    return times.astype('datetime64[ns]').astype('datetime64[M]').astype(np.int64) // 3
+
+def label(quarter):
+    '''
+    quarters since 1970 -> 2019Q4, ...
+    '''
+    return '{}Q{}'.format(1970 + quarter // 4, quarter % 4 + 1)
+
+class Extremes:
+    '''
+    the k highest and k lowest VPINs of a series, overall and
+    by quarter, in bounded heaps; add() the series chunk by
+    chunk, in any order (each chunk is narrowed down to its own
+    k candidates per quarter before touching the heaps)
+    '''
+
+    def __init__(self, k = k):
+        self.k = k
+        self.heaps = {}
+
+    def push(self, period, side, keys, times, vpins):
+        heap = self.heaps.setdefault((period, side), [])
+        for item in zip(keys.tolist(), times.tolist(), vpins.tolist()):
+            if len(heap) < self.k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heappushpop(heap, item)
+
+    def add(self, times, vpins):
+        times = np.asarray(times).astype('datetime64[ns]').view(np.int64)
+        vpins = np.asarray(vpins, dtype = float)
+        if len(vpins) == 0:
+            return
+        codes = quarters(times)
+        for code in np.unique(codes):
+            mask = codes == code
+            period = label(int(code))
+            t, v = times[mask], vpins[mask]
+            for side, keys in [('top', v), ('bottom', -v)]:
+                if len(keys) > self.k:
+                    best = np.argpartition(-keys, self.k - 1)[:self.k]
+                else:
+                    best = np.arange(len(keys))
+                self.push(period, side, keys[best], t[best], v[best])
+
+    def rows(self):
+        '''
+        (period, side, rank, epoch nanoseconds, VPIN) of every
+        extreme, rank 1 the most extreme; period '*' is the
+        whole series
+        '''
+        overall = {}
+        for (period, side), heap in self.heaps.items():
+            overall.setdefault(side, []).extend(heap)
+        heaps = dict(self.heaps)
+        for side, items in overall.items():
+            heaps[('*', side)] = heapq.nlargest(self.k, items)
+        rows = []
+        for (period, side), heap in heaps.items():
+            for rank, (key, t, vpin) in enumerate(sorted(heap, reverse = True)):
+                rows.append((period, side, rank + 1, t, vpin))
+        return rows
+
+def files(root):
+    '''
+    ticker -> VPIN file, for a directory of CSVs (vpin.py's
+    default output) or a vpinstore
+    '''
+    out = {}
+    for fname in os.listdir(root):
+        if fname.endswith('.csv'):
+            out[fname[:-4]] = os.path.join(root, fname)
+        elif fname.endswith('.npy') and not fname.endswith('.idx.npy'):
+            out[fname[:-4]] = os.path.join(root, fname)
+    return out
+
+def read_chunks(fname):
+    '''
+    yield a VPIN file's (times, VPINs), chunksize at a time
+    '''
+    if fname.endswith('.npy'):
+        data = np.load(fname, mmap_mode = 'r')
+        for i in range(0, len(data), chunksize):
+            chunk = data[i:i + chunksize]
+            yield chunk['time'], chunk['vpin']
+        return
+    for chunk in pd.read_csv(fname, chunksize = chunksize):
+        yield pd.to_datetime(chunk['timestamp']).values, chunk['vpin'].values
+
+def scan(task):
+    '''
+    the extremes of one file; task is (fname, k)
+    '''
+    fname, k = task
+    extremes = Extremes(k)
+    for times, vpins in read_chunks(fname):
+        extremes.add(times, vpins)
+    return extremes.rows()
+
+def stat(fname):
+    s = os.stat(fname)
+    return '{}:{}'.format(s.st_size, s.st_mtime_ns)
+
+class Index:
+    '''
+    the extreme VPINs of every ticker in a directory of VPIN
+    series, in a SQLite file; update() rescans only the tickers
+    whose files are new or changed (by size and modification
+    time) and drops those whose files are gone
+    '''
+
+    def __init__(self, root, path = None, k = k):
+        self.root = root
+        self.k = k
+        self.cnxn = sqlite3.connect(path or os.path.join(root, 'extremes.db'))
+        self.cnxn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                ticker TEXT PRIMARY KEY,
+                stat TEXT,
+                k INTEGER
+            )
+            ''')
+        self.cnxn.execute('''
+            CREATE TABLE IF NOT EXISTS extremes (
+                ticker TEXT,
+                period TEXT,
+                side TEXT,
+                rank INTEGER,
+                time INTEGER,
+                vpin REAL,
+                PRIMARY KEY (ticker, period, side, rank)
+            )
+            ''')
+        self.cnxn.commit()
+
+    def update(self, workers = None):
+        '''
+        bring the index up to date w/ the files, scanning
+        changed files in parallel; returns the tickers scanned
+        '''
+        current = files(self.root)
+        known = dict((ticker, (s, k)) for ticker, s, k in self.cnxn.execute('SELECT ticker, stat, k FROM files'))
+        stats = dict((ticker, stat(fname)) for ticker, fname in current.items())
+        todo = [ticker for ticker in current if known.get(ticker) != (stats[ticker], self.k)]
+        gone = [ticker for ticker in known if ticker not in current]
+        with self.cnxn:
+            for ticker in gone:
+                self.cnxn.execute('DELETE FROM extremes WHERE ticker = ?', (ticker,))
+                self.cnxn.execute('DELETE FROM files WHERE ticker = ?', (ticker,))
+        tasks = dict(((current[ticker], self.k), ticker) for ticker in todo)
+        sizes = dict((task, os.path.getsize(task[0])) for task in tasks)
+        for task, rows in run(scan, tasks, sizes, workers = workers):
+            ticker = tasks[task]
+            with self.cnxn:
+                self.cnxn.execute('DELETE FROM extremes WHERE ticker = ?', (ticker,))
+                self.cnxn.executemany(
+                    'INSERT INTO extremes VALUES (?, ?, ?, ?, ?, ?)',
+                    [(ticker,) + row for row in rows]
+                    )
+                self.cnxn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (ticker, stats[ticker], self.k))
+        return todo
+
+    def lookup(self, tickers, n = 15, side = 'top', period = '*'):
+        '''
+        the n highest (side 'top') or lowest ('bottom') VPINs of
+        each ticker, over its whole series (period '*') or in a
+        quarter, most extreme first; columns ticker, period,
+        timestamp, VPIN
+        '''
+        if n > self.k:
+            raise ValueError('the index keeps only {} extremes per side'.format(self.k))
+        query = '''
+            SELECT ticker, period, time, vpin FROM extremes
+            WHERE ticker = ? AND period = ? AND side = ? AND rank <= ?
+            ORDER BY rank
+            '''
+        rows = []
+        for ticker in tickers:
+            rows += self.cnxn.execute(query, (ticker, period, side, n)).fetchall()
+        df = pd.DataFrame(rows, columns = ['ticker', 'period', 'timestamp', 'VPIN'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype(np.int64))
+        return df
+
+    def tickers(self):
+        return [ticker for ticker, in self.cnxn.execute('SELECT ticker FROM files ORDER BY ticker')]
+
+    def close(self):
+        self.cnxn.close()
+
+if __name__ == '__main__':
+
+    # python extremes.py vpins/ (build or update the index)
+    index = Index(sys.argv[1])
+    print(len(index.update()), 'tickers scanned')
+    index.close()
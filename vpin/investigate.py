@@ -1,5 +1,22 @@
 import ssl
 import pandas as pd
+from extremes import Index
+
+# local VPIN series, w/ an index of their extremes in
+# vpins/extremes.db (built on the first run, then updated
+# for tickers whose series changed)
+vpin_path = 'vpins/'
+
+# how many stock-quarters, and how many VPINs of each
+n_stocks = 15
+n_vpins = 15
+
+# the lowest VPINs ('bottom') or the highest ('top')
+side = 'bottom'
+
+# the stock-quarter's own quarter (True) or the ticker's whole
+# series (False)
+by_quarter = False
 
 # load data
 ssl._create_default_https_context = ssl._create_unverified_context
@@ -7,24 +24,26 @@ url = 'https://raw.githubusercontent.com/thiagomarzagao/pin/main/pin_gan_lk_esti
 df = pd.read_csv(url)
 
 # select stock-quarters w/ highest PIN values
-df = df.sort_values(by = ['PIN'], ascending = False)[:15]
+df = df.sort_values(by = ['PIN'], ascending = False)[:n_stocks]
+
+# bring the index up to date
+index = Index(vpin_path)
+print(len(index.update()), 'tickers (re)indexed')
+indexed = set(index.tickers())
 
-# for each selected stock-quarter, get highest VPIN values
+# for each selected stock-quarter, get its extreme VPIN values
 data = []
 for i, row in df.iterrows():
     ticker = row['ticker']
-    pin = row['PIN']
-    url = 'https://raw.githubusercontent.com/thiagomarzagao/pin/main/vpin/vpins/{}.csv'.format(ticker)
-    try:
-        df_ticker = pd.read_csv(url)
-    except:
+    if ticker not in indexed:
+        print('no VPINs for', ticker)
         continue
-    df_ticker = df_ticker.sort_values(by = ['vpin'])[:15]
-    for j, nrow in df_ticker.iterrows():
-        tup = (ticker, pin, nrow['timestamp'], nrow['vpin'])
-        data.append(tup)
+    period = row['quarter'] if by_quarter else '*'
+    extremes = index.lookup([ticker], n_vpins, side = side, period = period)
+    extremes.insert(1, 'PIN', row['PIN'])
+    data.append(extremes[['ticker', 'PIN', 'timestamp', 'VPIN']])
+index.close()
 
-data = pd.DataFrame(data)
-data.columns = ['ticker', 'PIN', 'timestamp', 'VPIN']
+data = pd.concat(data, ignore_index = True)
 data.to_csv('to_investigate.csv', index = False)
 print(data)
@@ -1,260 +1,261 @@
 import os
+import sys
 import pyodbc
 import numpy as np
 import pandas as pd
-from rpy2 import robjects
-from random import randint
-from datetime import datetime
-from statsmodels.tsa.stattools import adfuller
+
+# shared modules live one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_tickers, window_totals, ticks_query, read_minute_bars
+from ticks import read_chunks, daily_volume
+import tickstore
+from results import ResultStore, fingerprint
+from trading_calendar import periods
+from metrics import Metrics
+from engine import VPIN, ChunkedVPIN, bvc_batch, bvc, get_V
+import vpinstore
 
 # path to output data
 path = '/vpins/'
 
+# where ticks come from: 'db' (the database below) or 'store'
+# (a local tick store at store_path, built w/ tickstore.convert)
+source = 'db'
+store_path = '/path/to/tickstore/'
+
 # connect to database
-cnxn = pyodbc.connect(
-    driver = 'ODBC Driver 17 for SQL Server',
-    server = '',
-    database = '',
-    uid = '',
-    pwd = '',
-    chartset = 'UTF-8'
-)
-cursor = cnxn.cursor()
+if source == 'db':
+    cnxn = pyodbc.connect(
+        driver = 'ODBC Driver 17 for SQL Server',
+        server = '',
+        database = '',
+        uid = '',
+        pwd = '',
+        chartset = 'UTF-8'
+    )
+    dialect = 'mssql'
 
 # get all tickers
-tickers = []
-for row in cursor.tables():
-    table_name = row.table_name
-    if len(table_name) in (5, 6):
-        if table_name[:4].isalpha():
-            if table_name[:4].isupper():
-                if table_name[4:].isnumeric():
-                    tickers.append(table_name)
-tickers = sorted(tickers)
-
-# ignore already computed
-done = []
-for fname in os.listdir(path):
-    ticker = fname.replace('.csv', '')
-    done.append(ticker)
-
-# get start and end of each quarter
-quarters = [
-    ('2019Q4', 61, datetime(2019, 10, 1), datetime(2019, 12, 31)),
-    ('2020Q1', 62, datetime(2020, 1, 1), datetime(2020, 3, 31)),
-    ('2020Q2', 61, datetime(2020, 4, 1), datetime(2020, 6, 30)),
-    ('2020Q3', 65, datetime(2020, 7, 1), datetime(2020, 9, 30)),
-    ('2020Q4', 61, datetime(2020, 10, 1), datetime(2020, 12, 31)),
-    ('2021Q1', 60, datetime(2021, 1, 1), datetime(2021, 3, 31))
-]
+if source == 'db':
+    tickers = get_tickers(cnxn, dialect)
+else:
+    tickers = tickstore.get_tickers(store_path)
 
-# check if buy or sell transaction
-def buy_or_sell(flag):
-    '''
-    see https://www.mql5.com/en/forum/75268
-    for explanation on MetaTrader flags
-    '''
-    if (flag & 32) and (flag & 64):
-        return 'both'
-    elif flag & 32:
-        return 'buy'
-    elif flag & 64:
-        return 'sell'
-    else:
-        return 'neither' # shouldn't happen w/ trade ticks
+# estimation periods, from the B3 calendar
+quarters = periods('Q', '2019-10-01', '2021-03-31')
 
 # how many buckets to use in each update?
 n = 250
 
-# loop through every quarter and ticker
+# compute VPIN w/ the vectorized engine (True) or tick by tick
+# (False); same output, and either way ticks are streamed in
+# chunks, w/ V asked of the database first, so at most
+# chunksize ticks are in memory at a time
+batch = True
+chunksize = 1000000
+
+# how trades are signed: 'flags' (each tick by its MetaTrader
+# buy/sell flags, dropping ticks w/ both or neither) or 'bvc'
+# (bulk volume classification of bar_seconds time bars, by
+# standardized price changes; uses every tick, flags or not,
+# always in one batch, and writes to path/bvc/, same format)
+mode = 'flags'
+bar_seconds = 60
+
+# read BVC's 60-second bars off the rollups the scraper keeps in
+# the database (source 'db'), instead of scanning ticks (V comes
+# off the daily rollups anyway, for tickers that have them)
+rollups = False
+
+# output format: 'csv' (a timestamp,vpin CSV per ticker) or 'bin'
+# (vpinstore: packed binary, memory-mappable, w/ a time index)
+output = 'csv'
+
+if rollups and (source != 'db'):
+    raise ValueError("rollups are kept in the database (source = 'db')")
+
+# all quarters are read in a single scan per ticker
+first_day = min(tup[2] for tup in quarters).strftime('%Y-%m-%d')
+last_day = max(tup[3] for tup in quarters).strftime('%Y-%m-%d')
+
+# ignore already computed: a ticker is done once its CSV is
+# complete and recorded in the result store w/ the same
+# fingerprint (i.e., the ticker's data from first_day to
+# last_day hasn't changed, day by day)
+store = ResultStore(path + 'results.db')
+method_name = 'VPIN-n{}'.format(n)
+out_path = path
+if mode == 'bvc':
+    method_name = 'BVC-VPIN-n{}-{}s'.format(n, bar_seconds)
+    out_path = path + 'bvc/'
+if (mode == 'bvc') and rollups and (bar_seconds == 60):
+    method_name += '-rollups'
+if output == 'bin':
+    method_name += '-bin'
+    out_path += 'bin/'
+os.makedirs(out_path, exist_ok = True)
+period = '{}:{}'.format(first_day, last_day)
+
+# per-stage wall time, rows and peak memory of every ticker, and
+# events like nodata, go to out_path/metrics.jsonl (see where a
+# run's time went w/ python metrics.py out_path/metrics.jsonl)
+metrics = Metrics(out_path + 'metrics.jsonl')
+if source == 'db':
+    totals = window_totals(cnxn, tickers, first_day, last_day, dialect)
+else:
+    totals = dict((ticker, tickstore.window_totals(store_path, ticker, first_day, last_day)) for ticker in tickers)
+fingerprints = {}
+done = []
+for ticker in tickers:
+    fingerprints[ticker] = fingerprint(first_day, last_day, *totals[ticker])
+    if store.done(ticker, method_name, fingerprints[ticker]):
+        done.append(ticker)
+
+# load a ticker's ticks, classified as buys or sells
+def load_chunks(ticker, drop = True, timer = None):
+    columns = ('ticktime', 'time_msc', 'flags', 'volume')
+    if mode == 'bvc':
+        columns += ('last',)
+    if source == 'store':
+        return tickstore.read_chunks(store_path, ticker, first_day, last_day, columns, drop, timer)
+    query = ticks_query(ticker, first_day, last_day, columns = columns, dialect = dialect)
+    return read_chunks(cnxn, query, chunksize, drop, timer)
+
+# get V w/o loading ticks, from the daily totals already read
+# for the fingerprint (or, off the store, from its volume column);
+# like the ticks themselves, only trade dates from first_day to
+# last_day count (so V doesn't move as the tables grow)
+def load_V(ticker):
+    if source == 'store':
+        return get_V(tickstore.read_daily_volume(store_path, ticker, first_day, last_day))
+    return get_V([row[2] for row in totals[ticker]])
+
+# loop through every ticker
 for i, ticker in enumerate(tickers):
 
     if ticker in done:
         continue
-
-    # initialize counters
-    total_volume = 0
-    buy_volume = 0
-    sell_volume = 0
-    buckets = []
-    output = []
-
-    # get V
-    query = '''
-    SET DATEFORMAT ymd;
-
-    SELECT 
-        CAST(ticktime AS date) AS date, 
-        SUM(volume) AS volume 
-    FROM dbo.[{}] 
-    GROUP BY CAST(ticktime AS date) 
-    ORDER BY CAST(ticktime AS date)
-    '''.format(ticker)
-    df = pd.read_sql(query, cnxn)
-    if df.shape[0]:
-        avg_daily_vol = df['volume'].sum() / df.shape[0]
-        V = int(avg_daily_vol / 50) # set V to 1/50th of avg daily volume
-    else:
-        continue
-
-    # loop through quarters
-    for tup in quarters:
-        quarter = tup[0]
-        trading_days = tup[1]
-        date_start = tup[2].strftime('%Y-%m-%d')
-        date_end = tup[3].strftime('%Y-%m-%d')
-        print(' ')
-        print(i, quarter, ticker)
-
-        # load tick data
-        query = '''
-        SET DATEFORMAT ymd;  
-
-        SELECT 
-            [ticktime], 
-            [flags],
-            [volume]
-        FROM [db_stonks].[dbo].[{}]
-        WHERE [ticktime] >= CAST(N'{} 00:00:00' AS DateTime)
-        AND [ticktime] <= CAST(N'{} 23:59:59' AS DateTime)
-        '''.format(ticker, date_start, date_end)
-        try:
-            df = pd.read_sql(query, cnxn)
-        except MemoryError:
-            l = ','.join([
-                ticker, 
-                quarter, 
-                ' ', 
-                ' ',
-                ' ' ,
-                'MemoryError',
-                '\n'
-                ])
-            with open('log.txt', mode = 'a') as f:
-                f.write(l)
-            print('MemoryError')
-            continue
-
-        # drop if zero data
-        if df.shape[0] == 0:
-            l = ','.join([
-                ticker, 
-                quarter, 
-                ' ', 
-                ' ',
-                ' ',
-                'nodata',
-                '\n'
-                ])
-            with open('log.txt', mode = 'a') as f:
-                f.write(l)
-            print('nodata')
-            continue
-
-        # fix time column
-        df['ticktime'] = pd.to_datetime(df['ticktime'])
-        df = df.sort_values(by = 'ticktime')
-        df.set_index('ticktime', inplace = True)
-
-        # add column saying if buy or sell
-        df['trade'] = df['flags'].apply(buy_or_sell)
-        del df['flags']
-
-        # drop simultaneous transactions (buy AND sell)
-        df = df[df['trade'] != 'both']
-
-        # drop non-transactions (shouldn't happen but who knows)
-        df = df[df['trade'] != 'neither']
-
-        # recode buy/sell flags
-        df['B'] = df['trade'].map(lambda x: 1 if x == 'buy' else 0)
-        df['S'] = df['trade'].map(lambda x: 1 if x == 'sell' else 0)
-        del df['trade']
-
-        # VPIN algorithm
-        for row in df.iterrows():
-
-            # calculate VPIN
-            if len(buckets) == n:
-                imbalance = 0
-                for bucket in buckets:
-                    diff = bucket[0] - bucket[1]
-                    imbalance += abs(diff)
-                vpin = imbalance / (n * V)
-
-                # sanity check
-                if (vpin < 0) or (vpin > 1):
-                    print('ALL HELL BROKE LOOSE!')
-                    quit()
-
-                output.append((row[0], vpin))
-
-                # discard first bucket
-                buckets = buckets[1:]
-
-            # excess volume from before triggers V?
-            if total_volume >= V:
-
-                # get excess volume
-                excess = total_volume - V
-
-                # store new bucket
-                if buy:
-                    buckets.append((0, V))
-                else:
-                    buckets.append((V, 0))
-
-                # put excess volume into next bucket
-                total_volume = excess
-                if buy:
-                    buy_volume = excess
-                    sell_volume = 0
+    print(' ')
+    print(i, ticker)
+    timer = metrics.timer(ticker, period)
+
+    # one scan over the ticker's ticks
+    try:
+        if (mode == 'bvc') and rollups and (bar_seconds == 60):
+
+            # 1-minute bars, stamped at their end
+            with timer('query'):
+                V = load_V(ticker)
+                bars = read_minute_bars(cnxn, ticker, first_day, last_day, dialect)
+            timer.add_rows('query', len(bars))
+        elif mode == 'bvc':
+
+            # load all ticks (incl. simultaneous transactions and
+            # non-transactions, which count towards V)
+            ticks = [e for e in load_chunks(ticker, drop = False, timer = timer)]
+            with timer('aggregate', sum(len(e) for e in ticks)):
+                if len(ticks) == 0:
+                    V = 0
                 else:
-                    sell_volume = excess
-                    buy_volume = 0
-                continue
-
-            # get tick's volume
-            new_volume = row[1]['volume']
-
-            # get direction
-            if row[1]['B'] == 1:
-                buy = True
-            else:
-                buy = False
-
-            # triggers V?
-            if total_volume + new_volume >= V:
-
-                # get excess volume
-                excess = (total_volume + new_volume) - V
-
-                # store new bucket
-                if buy:
-                    buckets.append((sell_volume, V - sell_volume))
-                else:
-                    buckets.append((V - buy_volume, buy_volume))
-
-                # put excess volume into next bucket
-                total_volume = excess
-                if buy:
-                    buy_volume = excess
-                    sell_volume = 0
-                else:
-                    sell_volume = excess
-                    buy_volume = 0
-                continue
-
-            # add new volume to current bucket
-            total_volume += new_volume
-            if buy:
-                buy_volume += new_volume
-            else:
-                sell_volume += new_volume
+                    ticks = pd.concat(ticks, ignore_index = True)
+                    V = get_V(daily_volume(ticks))
+        else:
+
+            # get V first, so ticks can be streamed
+            with timer('query'):
+                V = load_V(ticker)
+    except MemoryError:
+        timer.flush()
+        metrics.event(ticker, period, 'MemoryError')
+        l = ','.join([
+            ticker, 
+            ' ', 
+            ' ', 
+            ' ',
+            ' ' ,
+            'MemoryError',
+            '\n'
+            ])
+        with open('log.txt', mode = 'a') as f:
+            f.write(l)
+        print('MemoryError')
+        continue
 
+    # drop if zero data
+    if V == 0:
+        l = ','.join([
+            ticker, 
+            ' ', 
+            ' ', 
+            ' ',
+            ' ',
+            'nodata',
+            '\n'
+            ])
+        with open('log.txt', mode = 'a') as f:
+            f.write(l)
+        print('nodata')
+        timer.flush()
+        metrics.event(ticker, period, 'nodata')
+        store.commit(ticker, method_name, fingerprints[ticker], [])
+        continue
 
-    if len(output) > 0:
-        output = pd.DataFrame(output)
-        output.columns = ['timestamp', 'vpin']
-        output.set_index('timestamp', inplace = True)
-        output.to_csv(path + ticker + '.csv')
\ No newline at end of file
+    # VPIN algorithm
+    if (mode == 'bvc') and rollups and (bar_seconds == 60):
+        with timer('estimate', len(bars)):
+            times, vpins = bvc(
+            (bars['minute'] + pd.Timedelta(minutes = 1)).values,
+                bars['close'].values,
+                bars['volume'].values,
+                V,
+                n
+                )
+        del bars
+    elif mode == 'bvc':
+        with timer('estimate', len(ticks)):
+            times, vpins = bvc_batch(
+                ticks['time'].values.astype('datetime64[ns]'),
+                ticks['price'].values,
+                ticks['volume'].values,
+                V,
+                n,
+                bar_seconds
+                )
+        del ticks
+    else:
+        engine = ChunkedVPIN(V, n) if batch else VPIN(V, n)
+        times, vpins = [], []
+        for ticks in load_chunks(ticker, timer = timer):
+            with timer('estimate', len(ticks)):
+                t, v = engine.update_many(
+                    ticks['time'].values.astype('datetime64[ns]'),
+                    ticks['volume'].values,
+                    ticks['side'].values == 1
+                    )
+            times.append(t)
+            vpins.append(v)
+        times = np.concatenate(times) if len(times) else np.array([], dtype = 'datetime64[ns]')
+        vpins = np.concatenate(vpins) if len(vpins) else np.array([])
+
+    # sanity check
+    if (vpins < 0).any() or (vpins > 1).any():
+        print('ALL HELL BROKE LOOSE!')
+        quit()
+
+    # write the series under a temporary name, then rename it,
+    # so a crash never leaves a half-written file behind
+    with timer('write', len(vpins)):
+        if (len(vpins) > 0) and (output == 'bin'):
+            vpinstore.write(out_path, ticker, times, vpins)
+        elif len(vpins) > 0:
+            output_df = pd.DataFrame({
+                'timestamp': times,
+                'vpin': vpins,
+                })
+            output_df.set_index('timestamp', inplace = True)
+            output_df.to_csv(out_path + ticker + '.csv.tmp')
+            os.replace(out_path + ticker + '.csv.tmp', out_path + ticker + '.csv')
+        store.commit(ticker, method_name, fingerprints[ticker], [(period, [V, len(vpins)])])
+    timer.flush()
+
+store.close()
@@ -0,0 +1,107 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# on-disk layout: <root>/PETR4.npy holds the series as packed
+# (int64 epoch nanoseconds, float32 VPIN) records, memory-mapped
+# on read; <root>/PETR4.idx.npy holds every stride-th timestamp,
+# a sparse index that narrows lookups down to a block of records
+record = np.dtype([('time', '<i8'), ('vpin', '<f4')])
+stride = 4096
+
+def paths(root, ticker):
+    return os.path.join(root, ticker + '.npy'), os.path.join(root, ticker + '.idx.npy')
+
+def get_tickers(root):
+    '''
+    tickers in the store
+    '''
+    return sorted(fname[:-4] for fname in os.listdir(root) if fname.endswith('.npy') and not fname.endswith('.idx.npy'))
+
+def write(root, ticker, times, vpins):
+    '''
+    store a ticker's VPIN series (times in order), replacing
+    whatever was there; files are written under temporary
+    names and then renamed
+    '''
+    data = np.empty(len(vpins), dtype = record)
+    data['time'] = np.asarray(times).astype('datetime64[ns]').view(np.int64)
+    data['vpin'] = vpins
+    data_path, index_path = paths(root, ticker)
+    with open(data_path + '.tmp', 'wb') as f:
+        np.save(f, data)
+    with open(index_path + '.tmp', 'wb') as f:
+        np.save(f, data['time'][::stride])
+    os.replace(data_path + '.tmp', data_path)
+    os.replace(index_path + '.tmp', index_path)
+
+class Series:
+    '''
+    a ticker's stored VPIN series, memory-mapped; lookups
+    touch the sparse index and one or two blocks of records,
+    never the whole file
+    '''
+
+    def __init__(self, root, ticker):
+        data_path, index_path = paths(root, ticker)
+        self.data = np.load(data_path, mmap_mode = 'r')
+        self.index = np.load(index_path)
+
+    def __len__(self):
+        return len(self.data)
+
+    def position(self, t, side = 'left'):
+        '''
+        where t would go in the series (like np.searchsorted)
+        '''
+        t = np.datetime64(pd.Timestamp(t), 'ns').view(np.int64)
+        block = max(np.searchsorted(self.index, t, side = side) - 1, 0)
+        lo = block * stride
+        times = self.data['time'][lo:lo + stride + 1]
+        return lo + np.searchsorted(times, t, side = side)
+
+    def range(self, start, end):
+        '''
+        times and VPINs from start to end (inclusive)
+        '''
+        lo = self.position(start, 'left')
+        hi = self.position(end, 'right')
+        data = self.data[lo:hi]
+        return data['time'].view('datetime64[ns]'), data['vpin'].astype(float)
+
+    def at(self, t):
+        '''
+        the last VPIN at or before t, as (time, VPIN), or
+        None if the series starts after t
+        '''
+        i = self.position(t, 'right') - 1
+        if i < 0:
+            return None
+        return np.int64(self.data['time'][i]).astype('datetime64[ns]'), float(self.data['vpin'][i])
+
+    def all(self):
+        return self.data['time'].view('datetime64[ns]'), self.data['vpin'].astype(float)
+
+def read_csv(fname):
+    '''
+    a VPIN CSV (timestamp,vpin) -> times, VPINs
+    '''
+    df = pd.read_csv(fname)
+    return pd.to_datetime(df['timestamp']).values.astype('datetime64[ns]'), df['vpin'].values
+
+def convert(csv_path, root):
+    '''
+    copy every ticker's VPIN CSV in csv_path into the store at root
+    '''
+    os.makedirs(root, exist_ok = True)
+    fnames = sorted(fname for fname in os.listdir(csv_path) if fname.endswith('.csv'))
+    for i, fname in enumerate(fnames):
+        times, vpins = read_csv(os.path.join(csv_path, fname))
+        write(root, fname[:-4], times, vpins)
+        print(i, 'of', len(fnames), fname[:-4], len(vpins))
+
+if __name__ == '__main__':
+
+    # python vpinstore.py vpins/ vpins_bin/
+    convert(sys.argv[1], sys.argv[2])